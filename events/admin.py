@@ -6,11 +6,14 @@ from events.forms import StreamForm
 from events.models import (
     CustomAPIKey,
     Event,
+    EventLiveRollup,
     EventStreamURL,
     EventSupportURL,
     Stream,
     StreamArchiveURL,
+    StreamLiveRollup,
     StreamNotification,
+    StreamSession,
 )
 
 
@@ -72,16 +75,53 @@ class StreamAdmin(admin.ModelAdmin):
 
 
 class StreamNotificationAdmin(admin.ModelAdmin):
-    list_display = ("stream", "kind", "sent_at")
+    list_display = (
+        "stream",
+        "kind",
+        "recipient",
+        "sent_at",
+        "attempts",
+        "next_attempt_at",
+    )
 
 
 class StreamArchiveURLAdmin(admin.ModelAdmin):
     list_display = ("stream", "url", "name")
 
 
+class StreamSessionAdmin(admin.ModelAdmin):
+    list_display = (
+        "stream",
+        "started_at",
+        "ended_at",
+        "ingest_node",
+        "redirect_url",
+        "rolled_up",
+    )
+    list_filter = ("stream__event",)
+
+
+class StreamLiveRollupAdmin(admin.ModelAdmin):
+    list_display = (
+        "stream",
+        "sessions",
+        "live_seconds",
+        "first_live_at",
+        "last_live_at",
+    )
+    list_filter = ("stream__event",)
+
+
+class EventLiveRollupAdmin(admin.ModelAdmin):
+    list_display = ("event", "sessions", "live_seconds", "live_streams")
+
+
 admin.site.unregister(APIKey)
 admin.site.register(CustomAPIKey, CustomAPIKeyAdmin)
 admin.site.register(Event, EventAdmin)
 admin.site.register(Stream, StreamAdmin)
 admin.site.register(StreamNotification, StreamNotificationAdmin)
 admin.site.register(StreamArchiveURL, StreamArchiveURLAdmin)
+admin.site.register(StreamSession, StreamSessionAdmin)
+admin.site.register(StreamLiveRollup, StreamLiveRollupAdmin)
+admin.site.register(EventLiveRollup, EventLiveRollupAdmin)
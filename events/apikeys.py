@@ -0,0 +1,68 @@
+from hashlib import sha256
+
+from django.utils import timezone
+
+from .cache import TTLCache
+from .models import CustomAPIKey
+
+
+class VerifiedAPIKey:
+    """What is needed to authorize a request with an already verified API key"""
+
+    __slots__ = ("prefix", "is_web", "expiry_date", "revoked")
+
+    def __init__(self, api_key):
+        self.prefix = api_key.prefix
+        self.is_web = api_key.is_web
+        self.expiry_date = api_key.expiry_date
+        self.revoked = api_key.revoked
+
+    @property
+    def is_usable(self):
+        return not self.revoked and (
+            self.expiry_date is None or self.expiry_date >= timezone.now()
+        )
+
+
+class APIKeyCache(TTLCache):
+    """Per-process LRU cache of verified API keys
+
+    Verifying an API key runs the password hasher on it, which is slow by
+    design.  Once a key has been verified, the SHA-256 digest of the key is
+    mapped to its flags, so that later requests with the same key neither hash
+    it again nor query the database.  Keys that fail verification are never
+    cached.  Entries are dropped when their CustomAPIKey is saved or deleted,
+    and expire after `API_KEY_CACHE_TTL` seconds (see `TTLCache`).
+
+    """
+
+    def __init__(self):
+        super().__init__("API_KEY_CACHE_TTL", "API_KEY_CACHE_MAX_SIZE")
+
+    def get(self, key):
+        """Return the VerifiedAPIKey for a key, or None if it is not valid"""
+        digest = sha256(key.encode()).digest()
+        entry = super().get(digest)
+        if entry is not None:
+            return entry
+        return self.load(key, digest)
+
+    def load(self, key, digest):
+        """Verify a key against the database and cache it"""
+        prefix, _, _ = key.partition(".")
+        try:
+            api_key = CustomAPIKey.objects.get(prefix=prefix)
+        except CustomAPIKey.DoesNotExist:
+            return None
+        if not api_key.is_valid(key):
+            return None
+
+        entry = VerifiedAPIKey(api_key)
+        self.set(digest, entry)
+        return entry
+
+    def invalidate(self, api_key):
+        self.discard(lambda d, e: e.prefix == api_key.prefix)
+
+
+api_key_cache = APIKeyCache()
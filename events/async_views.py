@@ -0,0 +1,102 @@
+"""Asynchronous versions of the nginx-rtmp callbacks
+
+These are meant to be served by an ASGI server (see `muxy.rtmp_asgi`), so that
+a single process can handle many concurrent callbacks.  Cached schedules and
+host resolutions are used directly from the event loop, and database access
+and DNS lookups are run in threads.
+
+"""
+from asgiref.sync import sync_to_async
+from django.http import Http404, HttpResponse, HttpResponseNotAllowed
+from django.utils import timezone
+
+from events.cache import schedule_cache
+from events.keyfilter import key_filter
+from events.models import Stream
+from events.ratelimit import get_publisher_address, rate_limiter, too_many_requests
+from events.views import (
+    PublishAction,
+    get_ingest_node,
+    get_publish_action,
+    get_publish_redirect_url,
+    get_publish_response,
+    get_update_response,
+    set_stream_live,
+    set_stream_offline,
+)
+
+
+async def get_stream_schedule_or_404(stream_key):
+    schedule = schedule_cache.peek(stream_key)
+    if schedule is not None:
+        return schedule
+    might_exist = await sync_to_async(key_filter.might_exist)(stream_key)
+    if not might_exist:
+        raise Http404("No Stream matches the given query.")
+    try:
+        return await sync_to_async(schedule_cache.load)(stream_key)
+    except Stream.DoesNotExist:
+        raise Http404("No Stream matches the given query.")
+
+
+def rtmp_callback(view, limit_rate=True):
+    """Only allow POST requests within rate limits, and exempt view from CSRF checks
+
+    `require_POST` and `csrf_exempt` wrap views in synchronous functions, so
+    they cannot be used for coroutines on Django 3.1.
+
+    """
+
+    async def wrapped_view(request):
+        if request.method != "POST":
+            return HttpResponseNotAllowed(["POST"])
+        if limit_rate and not rate_limiter.allow(get_publisher_address(request)):
+            return too_many_requests()
+        return await view(request)
+
+    wrapped_view.csrf_exempt = True
+    wrapped_view.__name__ = view.__name__
+    wrapped_view.__doc__ = view.__doc__
+    return wrapped_view
+
+
+@rtmp_callback
+async def on_publish(request):
+    stream_key = request.POST["name"]
+    schedule = await get_stream_schedule_or_404(stream_key)
+
+    now = timezone.now()
+    action = get_publish_action(schedule.stream, now)
+
+    redirect_url = get_publish_redirect_url(schedule, action)
+    if redirect_url:
+        redirect_url = await redirect_url.aresolve()
+
+    if action == PublishAction.GO_LIVE:
+        await sync_to_async(set_stream_live)(
+            schedule.stream, now, get_ingest_node(request), redirect_url
+        )
+
+    return get_publish_response(action, redirect_url)
+
+
+async def on_publish_done(request):
+    stream_key = request.POST["name"]
+    await sync_to_async(set_stream_offline)(stream_key, timezone.now())
+
+    print("[PUBLISH-DONE] Stream stopped streaming")
+    return HttpResponse("OK")
+
+
+on_publish_done = rtmp_callback(on_publish_done, limit_rate=False)
+
+
+async def on_update(request):
+    stream_key = request.POST["name"]
+    schedule = await get_stream_schedule_or_404(stream_key)
+
+    return get_update_response(schedule.stream, timezone.now())
+
+
+# Not rate limited, see events.views.on_update
+on_update = rtmp_callback(on_update, limit_rate=False)
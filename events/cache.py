@@ -0,0 +1,127 @@
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+
+from .models import Stream
+
+
+class TTLCache:
+    """Per-process LRU cache whose entries expire after some seconds
+
+    Entries are meant to be dropped when what they were loaded from changes in
+    this process (see `events.signals`).  As other processes may also change
+    it, entries also expire after the number of seconds in the `ttl_setting`
+    setting, and are never cached if it is 0.  Once `max_size_setting` entries
+    are cached, the least recently used ones are dropped.
+
+    """
+
+    def __init__(self, ttl_setting, max_size_setting):
+        self.ttl_setting = ttl_setting
+        self.max_size_setting = max_size_setting
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        """Return the cached value for a key, or None"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] > time.monotonic():
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[1]
+            self.misses += 1
+        return None
+
+    def set(self, key, value):
+        ttl = getattr(settings, self.ttl_setting)
+        if ttl <= 0:
+            return
+        with self._lock:
+            self._entries[key] = (time.monotonic() + ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > getattr(settings, self.max_size_setting):
+                self._entries.popitem(last=False)
+
+    def discard(self, predicate):
+        """Drop entries for which `predicate(key, value)` is true"""
+        with self._lock:
+            for key in [
+                k for k, (_, v) in self._entries.items() if predicate(k, v)
+            ]:
+                del self._entries[key]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+        self.hits = self.misses = 0
+
+    def stats(self):
+        return dict(size=len(self._entries), hits=self.hits, misses=self.misses)
+
+
+class ScheduleEntry:
+    """Snapshot of a Stream (and its Event) as needed by the nginx-rtmp callbacks
+
+    Holds the stream with its event already loaded, so that checking its
+    preparing/active windows does not hit the database, and the redirect URLs
+    already substituted for this stream (but not resolved, see `RTMPURL`).
+
+    """
+
+    __slots__ = ("stream", "rtmp_url", "test_rtmp_url")
+
+    def __init__(self, stream):
+        self.stream = stream
+        self.rtmp_url = stream.rtmp_url
+        self.test_rtmp_url = stream.test_rtmp_url
+
+
+class StreamScheduleCache(TTLCache):
+    """Per-process cache of stream key -> ScheduleEntry
+
+    Entries are dropped when the Stream or its Event are saved or deleted, and
+    expire after `STREAM_SCHEDULE_CACHE_TTL` seconds (see `TTLCache`).
+
+    """
+
+    def __init__(self):
+        super().__init__(
+            "STREAM_SCHEDULE_CACHE_TTL", "STREAM_SCHEDULE_CACHE_MAX_SIZE"
+        )
+
+    def get(self, key):
+        """Return the ScheduleEntry for a stream key
+
+        Raises Stream.DoesNotExist if there is no stream with that key.
+
+        """
+        entry = self.peek(key)
+        if entry is not None:
+            return entry
+        return self.load(key)
+
+    def peek(self, key):
+        """Return the cached ScheduleEntry for a stream key, or None"""
+        return super().get(key)
+
+    def load(self, key):
+        """Fetch a stream from the database and cache it"""
+        stream = Stream.objects.select_related("event").get(key=key)
+        entry = ScheduleEntry(stream)
+        self.set(key, entry)
+        return entry
+
+    def invalidate_stream(self, stream):
+        # Key may have changed since it was cached, so look for its id too
+        self.discard(lambda k, e: k == stream.key or e.stream.pk == stream.pk)
+
+    def invalidate_event(self, event):
+        self.discard(lambda k, e: e.stream.event_id == event.pk)
+
+
+schedule_cache = StreamScheduleCache()
@@ -1,72 +1,50 @@
-import os
-from datetime import timedelta
-from string import Template
-
-from django.apps import apps
-from django.core.mail import EmailMessage
-from django.db.models import Q
 from django.utils import timezone
 from django_cron import CronJobBase, Schedule
 
-from .models import Stream, StreamNotification
-from .utils import get_formatted_stream_timeframe
+from .notifications import get_streams_to_notify, queue_preparing_emails
+from .outbox import deliver_emails
+from .rollups import rollup_live_sessions
 
 
 class NotifyStreamPreparingJob(CronJobBase):
+    """Notifies publishers of streams about to start, polling every minute
+
+    `PreparingNotificationScheduler` notifies them on time (see the
+    run_notification_scheduler command), so this is only a fallback in case it
+    is not running.  Streams it already queued are skipped.
+
+    """
+
     RUN_EVERY_MINS = 1
 
     schedule = Schedule(run_every_mins=RUN_EVERY_MINS)
     code = "muxy.events.cron.notify_stream_preparing"
-    template_path = os.path.join(
-        apps.get_app_config("events").path,
-        "templates",
-        "emails",
-        "stream_preparing.txt",
-    )
-    subject = '$event_name: Your stream "$name" is about to start!'
 
     def do(self):
         now = timezone.now()
-        streams_in_preparing = Stream.objects.filter(
-            Q(starts_at__lte=now + timedelta(minutes=10)) & Q(starts_at__gt=now)
-        ).all()
+        # Delivered in batches by the outbox worker
+        queue_preparing_emails(get_streams_to_notify(now), now)
 
-        for stream in streams_in_preparing:
-            preparing_notif = stream.streamnotification_set.filter(
-                Q(kind=StreamNotification.Kinds.PREPARING)
-            ).first()
 
-            if not preparing_notif:
-                self.send_email(stream)
+class RollupLiveSessionsJob(CronJobBase):
+    RUN_EVERY_MINS = 5
 
-    def send_email(self, stream):
-        now = timezone.now()
+    schedule = Schedule(run_every_mins=RUN_EVERY_MINS)
+    code = "muxy.events.cron.rollup_live_sessions"
+
+    def do(self):
+        count = rollup_live_sessions()
+        return "Rolled up %d live sessions" % count
 
-        with open(self.template_path) as f:
-            body_tpl = f.read()
-
-        starts_in = (stream.starts_at - now).seconds // 60
-        starts_at, ends_at = get_formatted_stream_timeframe(stream)
-        variables = dict(
-            name=stream.publisher_name,
-            event_name=stream.event.name,
-            starts_at=starts_at,
-            ends_at=ends_at,
-            rtmp_url=stream.event.public_rtmp_url,
-            key=stream.key,
-            contact_email=stream.event.contact_email,
-            starts_in=starts_in,
-            preparation_time=stream.event.preparation_time,
-        )
-
-        body = Template(body_tpl).safe_substitute(variables)
-        subject = Template(self.subject).safe_substitute(variables)
-        to = [stream.publisher_email]
-        headers = {"Reply-To": stream.event.contact_email}
-        msg = EmailMessage(subject, body, None, to, headers=headers)
-
-        msg.send(fail_silently=False)
-
-        StreamNotification.objects.create(
-            stream=stream, kind=StreamNotification.Kinds.PREPARING, sent_at=now
-        )
+
+class DeliverEmailsJob(CronJobBase):
+    """Deliver queued emails, in case the deliver_emails worker is not running"""
+
+    RUN_EVERY_MINS = 1
+
+    schedule = Schedule(run_every_mins=RUN_EVERY_MINS)
+    code = "muxy.events.cron.deliver_emails"
+
+    def do(self):
+        sent, failed = deliver_emails()
+        return "Sent %d emails, %d failed" % (sent, failed)
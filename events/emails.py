@@ -0,0 +1,58 @@
+import os
+import threading
+from functools import lru_cache
+from string import Template
+
+from django.apps import apps
+from django.conf import settings
+
+
+class EmailTemplates:
+    """Registry of compiled email body templates
+
+    Each template file is read and compiled into a `string.Template` once.  In
+    DEBUG, files are checked for changes (by mtime) each time they are used,
+    so templates can be edited without restarting.
+
+    """
+
+    def __init__(self):
+        self._templates = {}
+        self._lock = threading.Lock()
+
+    def get(self, name):
+        """Template of a notification email, from templates/emails/<name>.txt"""
+        return self.get_file(
+            os.path.join(
+                apps.get_app_config("events").path,
+                "templates",
+                "emails",
+                f"{name}.txt",
+            )
+        )
+
+    def get_file(self, path):
+        """Template from any file, e.g. a custom one for notify_publishers"""
+        entry = self._templates.get(path)
+        if entry is not None and not settings.DEBUG:
+            return entry[1]
+
+        mtime = os.stat(path).st_mtime_ns
+        if entry is None or entry[0] != mtime:
+            with open(path) as f:
+                entry = (mtime, Template(f.read()))
+            with self._lock:
+                self._templates[path] = entry
+        return entry[1]
+
+    def clear(self):
+        with self._lock:
+            self._templates.clear()
+
+
+email_templates = EmailTemplates()
+
+
+@lru_cache(maxsize=128)
+def get_subject_template(subject):
+    return Template(subject)
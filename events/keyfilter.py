@@ -0,0 +1,122 @@
+import math
+import threading
+import time
+from hashlib import blake2b
+
+from django.conf import settings
+from django.db import connection
+
+from .models import Stream
+
+
+class BloomFilter:
+    """Compact set that may report false positives, but never false negatives"""
+
+    def __init__(self, capacity, error_rate=0.001):
+        capacity = max(capacity, 1)
+        self.size = max(
+            int(-capacity * math.log(error_rate) / (math.log(2) ** 2)), 8
+        )
+        self.hash_count = max(int(round(self.size / capacity * math.log(2))), 1)
+        self._bits = bytearray((self.size + 7) // 8)
+
+    def add(self, item):
+        for pos in self._positions(item):
+            self._bits[pos >> 3] |= 1 << (pos & 7)
+
+    def __contains__(self, item):
+        return all(
+            self._bits[pos >> 3] & (1 << (pos & 7)) for pos in self._positions(item)
+        )
+
+    def _positions(self, item):
+        digest = blake2b(item.encode(), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], "little")
+        h2 = int.from_bytes(digest[8:], "little") | 1
+        return ((h1 + i * h2) % self.size for i in range(self.hash_count))
+
+
+class StreamKeyFilter:
+    """Per-process filter of existing stream keys, to reject bad keys early
+
+    Keys that can't be stream keys (e.g. too long) or are missing from the
+    filter are rejected without querying the database.  New keys are added
+    when streams are saved in this process (see `events.signals`), and the
+    filter is rebuilt in the background every `STREAM_KEY_FILTER_TTL`
+    seconds, to pick up keys of streams created or re-keyed by other
+    processes (e.g. the API pool, when serving nginx-rtmp callbacks from their
+    own pool) and drop keys of deleted ones.  Until then, such new keys are
+    rejected like unknown ones, and publishers are let in once they retry.
+
+    """
+
+    def __init__(self):
+        self._bloom = None
+        self._built_at = None
+        self._rebuilding = False
+        self._lock = threading.Lock()
+        self.rejected = 0
+
+    def might_exist(self, key):
+        """Whether there may be a stream with this key
+
+        A False return value means there is certainly no such stream.
+
+        """
+        ttl = settings.STREAM_KEY_FILTER_TTL
+        if ttl <= 0:
+            return True
+        if not key or len(key) > Stream._meta.get_field("key").max_length:
+            self.rejected += 1
+            return False
+        if self._bloom is None or time.monotonic() - self._built_at >= ttl:
+            self._rebuild_in_background()
+        bloom = self._bloom
+        # Until first built, keys are looked up in the database instead
+        if bloom is None or key in bloom:
+            return True
+        self.rejected += 1
+        return False
+
+    def add(self, key):
+        with self._lock:
+            if self._bloom is not None:
+                self._bloom.add(key)
+
+    def rebuild(self):
+        keys = list(Stream.objects.values_list("key", flat=True))
+        # Leave room for keys added until the next rebuild
+        bloom = BloomFilter(capacity=max(len(keys) * 2, 1024))
+        for key in keys:
+            bloom.add(key)
+        with self._lock:
+            self._bloom = bloom
+            self._built_at = time.monotonic()
+
+    def clear(self):
+        with self._lock:
+            self._bloom = None
+            self._built_at = None
+        self.rejected = 0
+
+    def _rebuild_in_background(self):
+        # Requests keep using the current filter (or the database) meanwhile
+        with self._lock:
+            if self._rebuilding:
+                return
+            self._rebuilding = True
+        thread = threading.Thread(target=self._rebuild_and_close, daemon=True)
+        thread.start()
+
+    def _rebuild_and_close(self):
+        try:
+            self.rebuild()
+        except Exception as err:
+            print("[KEY-FILTER] Could not rebuild stream key filter: %s" % err)
+        finally:
+            self._rebuilding = False
+            # Threads get their own database connection
+            connection.close()
+
+
+key_filter = StreamKeyFilter()
@@ -0,0 +1,141 @@
+import atexit
+import threading
+from collections import defaultdict
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import Case, DateTimeField, F, Value, When
+
+from .models import Stream, StreamSession
+from .revisions import bump_event_revisions
+
+
+class LiveStateBuffer:
+    """Write-behind buffer of streams going live or offline
+
+    nginx-rtmp callbacks only record the new `live_at` of a stream, and the
+    live sessions started and ended, in memory.  Pending changes are written
+    every `LIVE_STATE_FLUSH_INTERVAL` seconds with a fixed number of queries,
+    and on exit.  Set the interval to 0 to write them right away.
+
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._timer = None
+        self._reset()
+
+    def set_live(self, stream, at, ingest_node="", redirect_url=""):
+        session = StreamSession(
+            stream_id=stream.pk,
+            started_at=at,
+            ingest_node=ingest_node or "",
+            redirect_url=redirect_url or "",
+        )
+        with self._lock:
+            self._live_at[stream.key] = at
+            self._started.append(session)
+        self._schedule_flush()
+
+    def set_offline(self, stream_key, at):
+        with self._lock:
+            self._live_at[stream_key] = None
+            self._ended[stream_key].append(at)
+        self._schedule_flush()
+
+    def flush(self):
+        """Write all pending changes to the database"""
+        with self._lock:
+            live_at, started, ended = self._live_at, self._started, self._ended
+            self._reset()
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+        if not live_at:
+            return
+
+        try:
+            with transaction.atomic():
+                self._write(live_at, started, ended)
+        except Exception:
+            # Keep changes for the next flush
+            with self._lock:
+                self._live_at = {**live_at, **self._live_at}
+                self._started[:0] = started
+                for key, ends in ended.items():
+                    self._ended[key][:0] = ends
+            raise
+
+    def clear(self):
+        """Drop all pending changes without writing them"""
+        with self._lock:
+            self._reset()
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+
+    def _write(self, live_at, started, ended):
+        streams = Stream.objects.filter(key__in=live_at)
+        streams.update(
+            live_at=Case(
+                *[When(key=k, then=Value(v)) for k, v in live_at.items()],
+                output_field=DateTimeField(),
+            )
+        )
+        # Streams are shown with their live state in the API
+        bump_event_revisions(streams.values("event_id"))
+
+        if started:
+            StreamSession.objects.bulk_create(started)
+
+        if ended:
+            stream_ids = dict(
+                Stream.objects.filter(key__in=ended).values_list("key", "pk")
+            )
+            # Each open session is closed by the first publish done after it
+            # started
+            whens = [
+                When(stream_id=stream_ids[key], started_at__lte=at, then=Value(at))
+                for key, ends in ended.items()
+                if key in stream_ids
+                for at in sorted(ends)
+            ]
+            if whens:
+                StreamSession.objects.filter(
+                    stream_id__in=stream_ids.values(), ended_at__isnull=True
+                ).update(
+                    ended_at=Case(
+                        *whens, default=F("ended_at"), output_field=DateTimeField()
+                    )
+                )
+
+    def _reset(self):
+        self._live_at = {}
+        self._started = []
+        self._ended = defaultdict(list)
+
+    def _schedule_flush(self):
+        interval = settings.LIVE_STATE_FLUSH_INTERVAL
+        if interval <= 0:
+            self.flush()
+            return
+        with self._lock:
+            if self._timer is None:
+                self._timer = threading.Timer(interval, self._flush_in_background)
+                self._timer.daemon = True
+                self._timer.start()
+
+    def _flush_in_background(self):
+        try:
+            self.flush()
+        except Exception as err:
+            print("[LIVE-STATE] Could not write live state of streams: %s" % err)
+            self._schedule_flush()
+        finally:
+            # This thread's connection would otherwise be left open
+            connection.close()
+
+
+live_state = LiveStateBuffer()
+
+atexit.register(live_state.flush)
@@ -0,0 +1,111 @@
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.mail import get_connection
+
+
+class FileCheckpoint:
+    """Ids of the messages already sent, appended to a file as they are sent
+
+    An interrupted run can then be resumed with the same file without
+    sending messages again.
+
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        if os.path.exists(path):
+            with open(path) as f:
+                self.done = {line.strip() for line in f if line.strip()}
+        else:
+            self.done = set()
+
+    def __contains__(self, message_id):
+        return str(message_id) in self.done
+
+    def add(self, message_id):
+        with self._lock:
+            with open(self.path, "a") as f:
+                f.write(f"{message_id}\n")
+            self.done.add(str(message_id))
+
+
+class BulkMailer:
+    """Sends many emails reusing one connection per batch
+
+    Messages are split in batches of `EMAIL_BATCH_SIZE`, sent by up to
+    `EMAIL_CONCURRENCY` threads, each with its own connection, at most
+    `EMAIL_RATE_LIMIT` messages per second overall (0 for no limit).
+
+    """
+
+    def __init__(self, batch_size=None, concurrency=None, rate=None, checkpoint=None):
+        self.batch_size = batch_size or settings.EMAIL_BATCH_SIZE
+        self.concurrency = concurrency or settings.EMAIL_CONCURRENCY
+        self.rate = settings.EMAIL_RATE_LIMIT if rate is None else rate
+        self.checkpoint = checkpoint
+        self._lock = threading.Lock()
+        self._next_send_at = 0
+
+    def send(self, messages):
+        """Send (id, EmailMessage) pairs
+
+        Messages whose id is in the checkpoint are skipped.  Returns the ids of
+        the messages sent, and a dict of failed ids to errors.
+
+        """
+        if self.checkpoint is not None:
+            messages = [(i, m) for i, m in messages if i not in self.checkpoint]
+        else:
+            messages = list(messages)
+        batches = [
+            messages[i : i + self.batch_size]
+            for i in range(0, len(messages), self.batch_size)
+        ]
+
+        sent, failed = [], {}
+        with ThreadPoolExecutor(max_workers=self.concurrency) as executor:
+            for batch_sent, batch_failed in executor.map(self.send_batch, batches):
+                sent.extend(batch_sent)
+                failed.update(batch_failed)
+        return sent, failed
+
+    def send_batch(self, messages):
+        sent, failed = [], {}
+        connection = get_connection()
+        try:
+            connection.open()
+        except Exception as err:
+            # Could not connect, so every message of the batch failed
+            return sent, {message_id: err for message_id, _ in messages}
+
+        try:
+            for message_id, message in messages:
+                self.wait()
+                try:
+                    # Uses the connection already opened, without closing it
+                    connection.send_messages([message])
+                except Exception as err:
+                    failed[message_id] = err
+                    continue
+                sent.append(message_id)
+                if self.checkpoint is not None:
+                    self.checkpoint.add(message_id)
+        finally:
+            connection.close()
+        return sent, failed
+
+    def wait(self):
+        """Wait for our turn to send a message, according to the rate limit"""
+        if self.rate <= 0:
+            return
+        with self._lock:
+            now = time.monotonic()
+            send_at = max(now, self._next_send_at)
+            self._next_send_at = send_at + 1 / self.rate
+        if send_at > now:
+            time.sleep(send_at - now)
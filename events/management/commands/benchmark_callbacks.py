@@ -0,0 +1,360 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from http.client import HTTPConnection, HTTPSConnection
+from urllib.parse import urlencode, urlparse
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import Client
+from django.test.utils import CaptureQueriesContext, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from events.cache import schedule_cache
+from events.keyfilter import key_filter
+from events.livestate import live_state
+from events.models import Event, Stream, get_uuid4
+from events.resolver import resolver
+
+ENDPOINTS = ("on-publish", "on-update", "on-publish-done", "flush")
+
+# Length of the seeded slots, back to back in each event
+SLOT_LENGTH = timedelta(minutes=20)
+
+
+class EndpointStats:
+    def __init__(self, name):
+        self.name = name
+        self.latencies = []
+        self.queries = []
+        self.errors = 0
+        # Wall time of the requests, which may have been concurrent
+        self.elapsed = 0.0
+
+    def record(self, latency, queries=None, error=False):
+        self.latencies.append(latency)
+        if queries is not None:
+            self.queries.append(queries)
+        if error:
+            self.errors += 1
+
+    def percentile(self, p):
+        latencies = sorted(self.latencies)
+        return latencies[int(round(p * (len(latencies) - 1)))]
+
+    @property
+    def mean_latency(self):
+        return sum(self.latencies) / len(self.latencies)
+
+    @property
+    def mean_queries(self):
+        return sum(self.queries) / len(self.queries)
+
+    def __str__(self):
+        return (
+            "{name:<16} {count:>7} {p50:>9.2f} {p99:>9.2f} {mean:>9.2f} "
+            "{rps:>9.0f} {errors:>7} {mean_queries:>10} {max_queries:>8}".format(
+                name=self.name,
+                count=len(self.latencies),
+                p50=self.percentile(0.5) * 1000,
+                p99=self.percentile(0.99) * 1000,
+                mean=self.mean_latency * 1000,
+                rps=len(self.latencies) / self.elapsed if self.elapsed else 0,
+                errors=self.errors,
+                mean_queries="%.2f" % self.mean_queries if self.queries else "-",
+                max_queries=max(self.queries) if self.queries else "-",
+            )
+        )
+
+
+class RemoteClient:
+    """Posts callbacks to a running server, over a connection per thread"""
+
+    def __init__(self, url):
+        url = urlparse(url)
+        self.connection_class = (
+            HTTPSConnection if url.scheme == "https" else HTTPConnection
+        )
+        self.netloc = url.netloc
+        self.prefix = url.path.rstrip("/")
+        self._local = threading.local()
+
+    def post(self, path, data):
+        """Post form data, and return the response status and latency"""
+        body = urlencode(data)
+        headers = {"Content-Type": "application/x-www-form-urlencoded"}
+        start = time.perf_counter()
+        try:
+            conn = self._get_connection()
+            conn.request("POST", self.prefix + path, body, headers)
+            response = conn.getresponse()
+            response.read()
+            status = response.status
+        except OSError:
+            # Connect again next time
+            self._local.connection = None
+            status = None
+        return status, time.perf_counter() - start
+
+    def _get_connection(self):
+        conn = getattr(self._local, "connection", None)
+        if conn is None:
+            conn = self._local.connection = self.connection_class(
+                self.netloc, timeout=30
+            )
+        return conn
+
+
+class Command(BaseCommand):
+    help = (
+        "Simulates nginx-rtmp traffic against the RTMP callbacks and reports "
+        "latency, throughput and queries per endpoint. By default requests are "
+        "made one at a time in this process, against a test database seeded "
+        "for the run. With --url, they are sent concurrently to a running "
+        "server instead, to measure how many publishers it can handle."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "-E", "--events", type=int, default=4, help="number of events to seed"
+        )
+        parser.add_argument(
+            "-S",
+            "--streams",
+            type=int,
+            default=50,
+            help="number of streams (publishers) per event, in consecutive slots",
+        )
+        parser.add_argument(
+            "-R",
+            "--rounds",
+            type=int,
+            default=10,
+            help="on_update rounds, one per NGINX_RTMP_UPDATE_TIMEOUT interval",
+        )
+        parser.add_argument(
+            "--budget",
+            nargs="+",
+            default=[],
+            metavar="ENDPOINT=QUERIES",
+            help="fail if mean queries per request of an endpoint exceed these, "
+            "e.g. on-update=0.1",
+        )
+        parser.add_argument(
+            "--url",
+            help="base URL of a running server serving the callbacks, e.g. "
+            "http://127.0.0.1:8001. Streams are then seeded in the configured "
+            "database, which the server must use, and deleted afterwards",
+        )
+        parser.add_argument(
+            "-c",
+            "--concurrency",
+            type=int,
+            default=10,
+            help="concurrent requests to the server given with --url",
+        )
+
+    def handle(self, *args, **options):
+        budgets = self.parse_budgets(options["budget"])
+        if options["url"]:
+            if budgets:
+                raise CommandError("Queries are only counted without --url")
+            stats, cache_stats = self.run_remote(options), {}
+        else:
+            stats, cache_stats = self.run_local(options)
+
+        self.stdout.write(
+            "{:<16} {:>7} {:>9} {:>9} {:>9} {:>9} {:>7} {:>10} {:>8}".format(
+                "endpoint",
+                "reqs",
+                "p50 ms",
+                "p99 ms",
+                "mean ms",
+                "req/s",
+                "errors",
+                "queries",
+                "max q",
+            )
+        )
+        for endpoint_stats in stats.values():
+            if endpoint_stats.latencies:
+                self.stdout.write(str(endpoint_stats))
+        if cache_stats:
+            self.stdout.write("")
+        for name, values in cache_stats.items():
+            self.stdout.write(
+                "{:<16} {}".format(
+                    name, " ".join("%s=%s" % item for item in values.items())
+                )
+            )
+
+        over_budget = [
+            "%s: %.2f > %.2f" % (name, stats[name].mean_queries, budget)
+            for name, budget in budgets.items()
+            if stats[name].mean_queries > budget
+        ]
+        if over_budget:
+            raise CommandError("Query budget exceeded: %s" % ", ".join(over_budget))
+
+    def run_local(self, options):
+        settings_overrides = dict(
+            ALLOWED_HOSTS=["testserver"],
+            # Live state is flushed explicitly and measured on its own
+            LIVE_STATE_FLUSH_INTERVAL=3600,
+            # All requests come from the same address
+            RATE_LIMIT_RATE=0,
+        )
+        old_name = connection.creation.create_test_db(
+            verbosity=0, autoclobber=True, serialize=False
+        )
+        with override_settings(**settings_overrides):
+            try:
+                keys = self.seed(options["events"], options["streams"])
+                stats = self.run(keys, options["rounds"])
+                # Before they are cleared below
+                cache_stats = self.get_cache_stats()
+            finally:
+                # Forget about the seeded streams
+                live_state.clear()
+                schedule_cache.clear()
+                key_filter.clear()
+                connection.creation.destroy_test_db(old_name, verbosity=0)
+        return stats, cache_stats
+
+    def run_remote(self, options):
+        client = RemoteClient(options["url"])
+        keys = self.seed(options["events"], options["streams"])
+        try:
+            self.wait_for_keys(client, keys)
+            return self.run(keys, options["rounds"], client, options["concurrency"])
+        finally:
+            # Left to the server to write, as the seeded streams are deleted
+            time.sleep(settings.LIVE_STATE_FLUSH_INTERVAL + 1)
+            Event.objects.filter(
+                pk__in=Stream.objects.filter(key__in=keys).values("event_id")
+            ).delete()
+
+    def get_cache_stats(self):
+        resolver_stats = resolver.stats()
+        for name in ("avg_lookup_time", "max_lookup_time"):
+            resolver_stats[name] = "%.2fms" % (resolver_stats[name] * 1000)
+        return {
+            "schedule cache": schedule_cache.stats(),
+            "host resolver": resolver_stats,
+            "key filter": dict(rejected=key_filter.rejected),
+        }
+
+    def parse_budgets(self, values):
+        budgets = {}
+        for value in values:
+            name, _, queries = value.partition("=")
+            if name not in ENDPOINTS:
+                raise CommandError("Unknown endpoint %s" % name)
+            budgets[name] = float(queries)
+        return budgets
+
+    def seed(self, events_count, streams_count):
+        now = timezone.now()
+        keys = []
+        for i in range(events_count):
+            event = Event.objects.create(
+                name="Benchmark %d" % i,
+                starts_at=now - timedelta(hours=1),
+                ends_at=now + SLOT_LENGTH * (streams_count + 1),
+                rtmp_url="rtmp://127.0.0.1/live/$key",
+                test_rtmp_url="rtmp://127.0.0.1/test/$key",
+            )
+            # Right after a slot changeover: the first stream just became
+            # active, the next one is preparing, and the others are connected
+            # early to the test server
+            starts_at = now - timedelta(minutes=1)
+            streams = [
+                Stream(
+                    event=event,
+                    key=get_uuid4(),
+                    starts_at=starts_at + SLOT_LENGTH * j,
+                    ends_at=starts_at + SLOT_LENGTH * (j + 1),
+                )
+                for j in range(streams_count)
+            ]
+            Stream.objects.bulk_create(streams)
+            keys.extend(s.key for s in streams)
+        return keys
+
+    def wait_for_keys(self, client, keys):
+        """Wait until the server's key filter knows about the seeded keys"""
+        timeout = time.monotonic() + settings.STREAM_KEY_FILTER_TTL * 3 + 5
+        path = reverse("on-update")
+        while time.monotonic() < timeout:
+            status, _ = client.post(path, {"name": keys[-1]})
+            if status == 200:
+                return
+            time.sleep(0.5)
+        raise CommandError("Seeded streams were not found by %s" % client.netloc)
+
+    def run(self, keys, rounds, remote_client=None, concurrency=1):
+        stats = {name: EndpointStats(name) for name in ENDPOINTS}
+        if remote_client is None:
+            client = Client()
+            schedule_cache.clear()
+            resolver.clear()
+            key_filter.clear()
+            # Not left to the first requests, which would otherwise be measured
+            key_filter.rebuild()
+
+        def request(name, key, i):
+            data = {
+                "name": key,
+                # Publishers are rate limited by their address
+                "addr": "10.%d.%d.%d" % (i >> 16 & 255, i >> 8 & 255, i & 255),
+            }
+            if remote_client is not None:
+                status, latency = remote_client.post(reverse(name), data)
+                stats[name].record(latency, error=status is None or status >= 400)
+                return
+            with CaptureQueriesContext(connection) as queries:
+                start = time.perf_counter()
+                response = client.post(reverse(name), data)
+                latency = time.perf_counter() - start
+            if response.status_code >= 400:
+                raise CommandError(
+                    "%s failed with status %d" % (name, response.status_code)
+                )
+            stats[name].record(latency, len(queries))
+
+        def run_phase(name):
+            start = time.perf_counter()
+            if concurrency > 1:
+                with ThreadPoolExecutor(max_workers=concurrency) as executor:
+                    names = [name] * len(keys)
+                    list(executor.map(request, names, keys, range(len(keys))))
+            else:
+                for i, key in enumerate(keys):
+                    request(name, key, i)
+            stats[name].elapsed += time.perf_counter() - start
+
+        def flush():
+            # The server flushes on its own
+            if remote_client is not None:
+                return
+            with CaptureQueriesContext(connection) as queries:
+                start = time.perf_counter()
+                live_state.flush()
+                elapsed = time.perf_counter() - start
+            stats["flush"].record(elapsed, len(queries))
+            stats["flush"].elapsed += elapsed
+
+        # Burst of publishers connecting at a slot changeover
+        run_phase("on-publish")
+        flush()
+
+        for _ in range(rounds):
+            run_phase("on-update")
+
+        run_phase("on-publish-done")
+        flush()
+
+        return stats
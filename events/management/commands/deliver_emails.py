@@ -0,0 +1,32 @@
+from django.core.management.base import BaseCommand
+
+from events import outbox
+
+
+class Command(BaseCommand):
+    help = (
+        "Delivers queued notification emails, retrying failed ones with "
+        "exponential backoff"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--once",
+            action="store_true",
+            help="deliver pending emails and exit, instead of polling for more",
+        )
+        parser.add_argument(
+            "-i",
+            "--interval",
+            type=int,
+            help="seconds between polls when there are no pending emails",
+        )
+
+    def handle(self, *args, **options):
+        if options["once"]:
+            sent, failed = outbox.deliver_emails()
+            self.stdout.write("Sent %d emails, %d failed" % (sent, failed))
+            return
+
+        self.stdout.write("Starting email delivery worker")
+        outbox.run_forever(interval=options["interval"])
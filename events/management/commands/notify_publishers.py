@@ -1,10 +1,11 @@
 import os
-from string import Template
 
 from django.core.mail import EmailMessage
 from django.core.management.base import BaseCommand, CommandError
+from events.emails import email_templates, get_subject_template
+from events.mailer import BulkMailer, FileCheckpoint
 from events.models import Event, Stream
-from events.utils import get_formatted_stream_timeframe
+from events.utils import get_formatted_stream_timeframes
 
 
 class Command(BaseCommand):
@@ -25,6 +26,20 @@ class Command(BaseCommand):
             type=int,
             help="only send notification to publishers from specific stream ids",
         )
+        parser.add_argument(
+            "--checkpoint",
+            help="file where sent stream ids are recorded, to resume an "
+            "interrupted run without sending emails again",
+        )
+        parser.add_argument(
+            "--batch-size", type=int, help="emails sent per SMTP connection"
+        )
+        parser.add_argument(
+            "--concurrency", type=int, help="number of concurrent SMTP connections"
+        )
+        parser.add_argument(
+            "--rate", type=float, help="maximum number of emails sent per second"
+        )
 
     def handle(self, *args, **options):
         event_id = options["event"]
@@ -37,7 +52,9 @@ class Command(BaseCommand):
                 event=event, pk__in=options["streams"]
             ).all()
             if not streams.exists():
-                raise CommandError("Streams with ids %s do not exist." % ids)
+                raise CommandError(
+                    "Streams with ids %s do not exist." % options["streams"]
+                )
         else:
             streams = Stream.objects.filter(event=event).all()
             if not streams.exists():
@@ -50,11 +67,14 @@ class Command(BaseCommand):
         if not os.path.exists(template_path):
             raise CommandError("Template file %s does not exist." % template_path)
 
-        with open(template_path) as f:
-            body_tpl = f.read()
+        body_tpl = email_templates.get_file(template_path)
+        subject_tpl = get_subject_template(options["subject"])
+
+        streams = list(streams.select_related("event"))
+        timeframes = get_formatted_stream_timeframes(streams)
 
-        for stream in streams:
-            starts_at, ends_at = get_formatted_stream_timeframe(stream)
+        messages = []
+        for stream, (starts_at, ends_at) in zip(streams, timeframes):
             variables = dict(
                 name=stream.publisher_name,
                 event_name=stream.event.name,
@@ -66,13 +86,35 @@ class Command(BaseCommand):
                 preparation_time=stream.event.preparation_time,
             )
 
-            body = Template(body_tpl).safe_substitute(variables)
-            subject = Template(options["subject"]).safe_substitute(variables)
+            body = body_tpl.safe_substitute(variables)
+            subject = subject_tpl.safe_substitute(variables)
             to = [stream.publisher_email]
             headers = {"Reply-To": stream.event.contact_email}
             msg = EmailMessage(subject, body, None, to, headers=headers)
+            messages.append((stream.pk, msg))
+
+        checkpoint = None
+        if options["checkpoint"]:
+            checkpoint = FileCheckpoint(options["checkpoint"])
+            pending = [(pk, msg) for pk, msg in messages if pk not in checkpoint]
+            if len(pending) < len(messages):
+                self.stdout.write(
+                    "Skip %d emails already sent" % (len(messages) - len(pending))
+                )
+            messages = pending
+
+        mailer = BulkMailer(
+            batch_size=options["batch_size"],
+            concurrency=options["concurrency"],
+            rate=options["rate"],
+            checkpoint=checkpoint,
+        )
+        self.stdout.write("Send %d emails" % len(messages))
+        sent, failed = mailer.send(messages)
 
-            self.stdout.write('Send email to %s with subject "%s"' % (to, subject))
-            msg.send(fail_silently=False)
+        for pk, err in failed.items():
+            self.stderr.write("Failed to send email to stream %d: %s" % (pk, err))
+        if failed:
+            raise CommandError("Failed to send %d emails." % len(failed))
 
-        self.stdout.write(self.style.SUCCESS("Successfully sent emails"))
+        self.stdout.write(self.style.SUCCESS("Successfully sent %d emails" % len(sent)))
@@ -0,0 +1,29 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from events.recordings import RecordingsIndex
+
+
+class Command(BaseCommand):
+    help = (
+        "Crawls RECORDINGS_ROOT like the recordings index does, and reports "
+        "its size and how long the crawl took. This is a dry run: each server "
+        "process keeps its own index in memory, which refreshes on its own "
+        "and is not affected by this command."
+    )
+
+    def handle(self, *args, **options):
+        if not settings.RECORDINGS_ROOT:
+            raise CommandError("RECORDINGS_ROOT is not set.")
+
+        index = RecordingsIndex()
+        start = time.perf_counter()
+        index.rebuild()
+        elapsed = time.perf_counter() - start
+        stats = index.stats()
+        self.stdout.write(
+            "Found %d files in %d directories in %.2fs"
+            % (stats["files"], stats["directories"], elapsed)
+        )
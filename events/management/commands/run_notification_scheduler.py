@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from events.notifications import PreparingNotificationScheduler
+
+
+class Command(BaseCommand):
+    help = (
+        "Notifies publishers right when their streams are about to start, "
+        "instead of polling every minute with NotifyStreamPreparingJob"
+    )
+
+    def handle(self, *args, **options):
+        self.stdout.write("Starting notification scheduler")
+        PreparingNotificationScheduler().run_forever()
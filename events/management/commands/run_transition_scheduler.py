@@ -0,0 +1,18 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from events.transitions import TransitionScheduler
+
+
+class Command(BaseCommand):
+    help = (
+        "Drops publishers from nginx-rtmp right when their streams become "
+        "active or inactive, so that they are redirected accordingly"
+    )
+
+    def handle(self, *args, **options):
+        if not settings.NGINX_RTMP_CONTROL_URLS:
+            raise CommandError("NGINX_RTMP_CONTROL_URLS is not set.")
+
+        self.stdout.write("Starting transition scheduler")
+        TransitionScheduler().run_forever()
@@ -0,0 +1,51 @@
+# Generated by Django 3.1.14 on 2026-10-18 20:05
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('events', '0025_auto_20241214_1133'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StreamSession',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('started_at', models.DateTimeField()),
+                ('ended_at', models.DateTimeField(blank=True, null=True)),
+                ('ingest_node', models.CharField(blank=True, max_length=255)),
+                ('redirect_url', models.CharField(blank=True, max_length=255)),
+                ('rolled_up', models.BooleanField(default=False)),
+                ('stream', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='sessions', to='events.stream')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='StreamLiveRollup',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('sessions', models.PositiveIntegerField(default=0)),
+                ('live_seconds', models.FloatField(default=0)),
+                ('first_live_at', models.DateTimeField(blank=True, null=True)),
+                ('last_live_at', models.DateTimeField(blank=True, null=True)),
+                ('stream', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='live_rollup', to='events.stream')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='EventLiveRollup',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('sessions', models.PositiveIntegerField(default=0)),
+                ('live_seconds', models.FloatField(default=0)),
+                ('live_streams', models.PositiveIntegerField(default=0)),
+                ('event', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='live_rollup', to='events.event')),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='streamsession',
+            index=models.Index(fields=['rolled_up', 'ended_at'], name='events_stre_rolled__787fe9_idx'),
+        ),
+    ]
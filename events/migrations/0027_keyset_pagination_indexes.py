@@ -0,0 +1,17 @@
+# Generated by Django 3.1.14 on 2026-10-18 20:13
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('events', '0026_live_sessions'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='event',
+            index=models.Index(fields=['-starts_at', '-id'], name='events_even_starts__36fd26_idx'),
+        ),
+    ]
@@ -0,0 +1,53 @@
+# Generated by Django 3.1.14 on 2026-10-18 20:19
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('events', '0027_keyset_pagination_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='streamnotification',
+            name='attempts',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='streamnotification',
+            name='body',
+            field=models.TextField(blank=True),
+        ),
+        migrations.AddField(
+            model_name='streamnotification',
+            name='claimed_by',
+            field=models.CharField(blank=True, editable=False, max_length=32),
+        ),
+        migrations.AddField(
+            model_name='streamnotification',
+            name='last_error',
+            field=models.TextField(blank=True),
+        ),
+        migrations.AddField(
+            model_name='streamnotification',
+            name='next_attempt_at',
+            field=models.DateTimeField(blank=True, db_index=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='streamnotification',
+            name='recipient',
+            field=models.EmailField(blank=True, max_length=254),
+        ),
+        migrations.AddField(
+            model_name='streamnotification',
+            name='reply_to',
+            field=models.EmailField(blank=True, max_length=254, null=True),
+        ),
+        migrations.AddField(
+            model_name='streamnotification',
+            name='subject',
+            field=models.CharField(blank=True, max_length=255),
+        ),
+    ]
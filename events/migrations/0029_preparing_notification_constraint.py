@@ -0,0 +1,39 @@
+# Generated by Django 3.1.14 on 2026-10-18 20:23
+
+from django.db import migrations, models
+
+
+def delete_duplicate_preparing_notifications(apps, schema_editor):
+    StreamNotification = apps.get_model("events", "StreamNotification")
+    seen = set()
+    duplicates = []
+    for pk, stream_id in (
+        StreamNotification.objects.filter(kind="PR", stream__isnull=False)
+        .order_by("pk")
+        .values_list("pk", "stream_id")
+    ):
+        if stream_id in seen:
+            duplicates.append(pk)
+        seen.add(stream_id)
+    StreamNotification.objects.filter(pk__in=duplicates).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('events', '0028_notification_outbox'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='streamnotification',
+            index=models.Index(fields=['stream', 'kind'], name='events_stre_stream__b672c1_idx'),
+        ),
+        migrations.RunPython(
+            delete_duplicate_preparing_notifications, migrations.RunPython.noop
+        ),
+        migrations.AddConstraint(
+            model_name='streamnotification',
+            constraint=models.UniqueConstraint(condition=models.Q(kind='PR'), fields=('stream', 'kind'), name='unique_stream_preparing_notification'),
+        ),
+    ]
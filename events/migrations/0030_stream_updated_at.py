@@ -0,0 +1,20 @@
+# Generated by Django 3.1.14 on 2026-10-18 20:30
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('events', '0029_preparing_notification_constraint'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='stream',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True, db_index=True, default=django.utils.timezone.now),
+            preserve_default=False,
+        ),
+    ]
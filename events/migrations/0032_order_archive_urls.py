@@ -0,0 +1,17 @@
+# Generated by Django 3.1.14 on 2026-10-18 20:47
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('events', '0031_event_revision'),
+    ]
+
+    operations = [
+        migrations.AlterModelOptions(
+            name='streamarchiveurl',
+            options={'ordering': ('id',)},
+        ),
+    ]
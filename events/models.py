@@ -1,8 +1,6 @@
-import os
-import socket
 import uuid
 from datetime import timedelta
-from glob import glob
+from functools import lru_cache
 from string import Template
 from urllib.parse import urljoin, urlparse
 
@@ -15,20 +13,94 @@ from django.forms.fields import URLField as FormURLField
 from django.utils.translation import gettext_lazy as _
 from rest_framework_api_key.models import AbstractAPIKey
 
+from .recordings import recordings_index
+from .resolver import resolver
+
+
+class RTMPURLTemplate:
+    """RTMP URL with $id/$key placeholders, parsed and compiled once
+
+    Substituting it for a stream only joins precomputed parts, and resolving
+    its host is a lookup on the resolver cache.  Use `compile_rtmp_url` to get
+    the (cached) template of an URL.
+
+    """
+
+    def __init__(self, url):
+        parsed = urlparse(url)
+        self.hostname = parsed.hostname
+        self._netloc = parsed.netloc
+
+        userinfo = ""
+        if parsed.username:
+            userinfo += parsed.username
+            if parsed.password:
+                userinfo += ":{}".format(parsed.password)
+            userinfo += "@"
+        self._scheme = "{}://".format(parsed.scheme)
+        self._userinfo = userinfo
+        self._port = ":{}".format(parsed.port) if parsed.port else ""
+
+        tail = parsed._replace(scheme="", netloc="").geturl()
+        self._parts, self._last = self._compile(tail)
+
+    @staticmethod
+    def _compile(tail):
+        # Same semantics as Template.safe_substitute
+        parts, pos = [], 0
+        for m in Template.pattern.finditer(tail):
+            literal = tail[pos : m.start()]
+            name = m.group("named") or m.group("braced")
+            if name:
+                parts.append((literal, name, m.group()))
+            elif m.group("escaped") is not None:
+                parts.append((literal + Template.delimiter, None, ""))
+            else:
+                parts.append((literal + m.group(), None, ""))
+            pos = m.end()
+        return parts, tail[pos:]
+
+    def substitute(self, **variables):
+        tail = "".join(
+            literal + (str(variables[name]) if name in variables else placeholder)
+            for literal, name, placeholder in self._parts
+        )
+        return RTMPURL(self, tail + self._last)
+
+    def join(self, host, tail):
+        if host is None:
+            return self._scheme + self._netloc + tail
+        return self._scheme + self._userinfo + str(host) + self._port + tail
+
+
+class RTMPURL:
+    """An RTMP URL template substituted for a stream"""
+
+    __slots__ = ("template", "tail")
+
+    def __init__(self, template, tail):
+        self.template = template
+        self.tail = tail
+
+    def __str__(self):
+        return self.template.join(None, self.tail)
+
+    def resolve(self):
+        ip = resolver.gethostbyname(self.template.hostname)
+        return self.template.join(ip, self.tail)
+
+    async def aresolve(self):
+        ip = await resolver.agethostbyname(self.template.hostname)
+        return self.template.join(ip, self.tail)
+
+
+@lru_cache(maxsize=256)
+def compile_rtmp_url(url):
+    return RTMPURLTemplate(url)
+
 
 def resolve_url(url):
-    parsed = urlparse(url)
-    ip = socket.gethostbyname(parsed.hostname)
-    n = ""
-    if parsed.username:
-        n += parsed.username
-        if parsed.password:
-            n += ":{}".format(parsed.password)
-        n += "@"
-    n += str(ip)
-    if parsed.port:
-        n += ":{}".format(parsed.port)
-    return parsed._replace(netloc=n).geturl()
+    return compile_rtmp_url(url).substitute().resolve()
 
 
 class RTMPURLFormField(FormURLField):
@@ -85,10 +157,29 @@ class Event(models.Model):
         blank=True, null=True, default=get_default_test_rtmp_url
     )
     contact_email = models.EmailField(blank=True, null=True)
+    # Bumped whenever the event or its streams change, see events.revisions
+    revision = models.PositiveIntegerField(default=0, editable=False)
 
     def __str__(self):
         return self.name
 
+    def save(self, *args, **kwargs):
+        # Never write back a revision that may have been bumped since this
+        # instance was loaded.  Unlike with a plain save, an instance whose row
+        # was deleted meanwhile is then not inserted again: saving it raises
+        # DatabaseError, unless with force_insert=True.
+        if (
+            not self._state.adding
+            and not kwargs.get("force_insert")
+            and kwargs.get("update_fields") is None
+        ):
+            kwargs["update_fields"] = [
+                f.name
+                for f in self._meta.concrete_fields
+                if not f.primary_key and f.name != "revision"
+            ]
+        super().save(*args, **kwargs)
+
     def is_active_at(self, at):
         return self.active and self.starts_at <= at and at < self.ends_at
 
@@ -119,6 +210,10 @@ class Event(models.Model):
         if self.starts_at and self.ends_at:
             return self.ends_at - self.starts_at
 
+    class Meta:
+        # Matches the API ordering, see muxy.pagination.KeysetPagination
+        indexes = [models.Index(fields=["-starts_at", "-id"])]
+
 
 class EventStreamURL(models.Model):
     event = models.ForeignKey(
@@ -165,6 +260,8 @@ class Stream(models.Model):
     ends_at = models.DateTimeField()
     key = models.CharField(max_length=36, default=get_uuid4, editable=True, unique=True)
     live_at = models.DateTimeField(blank=True, null=True, editable=False)
+    # Polled by schedulers running in their own process for changes
+    updated_at = models.DateTimeField(auto_now=True, db_index=True)
 
     def __str__(self):
         return "{event_name}: {publisher_name} ({starts_at} - {ends_at})".format(
@@ -177,11 +274,7 @@ class Stream(models.Model):
     @property
     def recording_paths(self):
         if settings.RECORDINGS_ROOT:
-            pattern = Template(settings.RECORDINGS_GLOB_PATTERN).safe_substitute(
-                event_slug=self.event.slug, key=self.key
-            )
-            abs_paths = sorted(glob(os.path.join(settings.RECORDINGS_ROOT, pattern)))
-            paths = [p.split(settings.RECORDINGS_ROOT)[1][1:] for p in abs_paths]
+            paths = recordings_index.paths(self.event.slug, self.key)
             return [urljoin(settings.RECORDINGS_URL, p) for p in paths]
         else:
             return []
@@ -220,27 +313,43 @@ class Stream(models.Model):
         return self.is_preparing_at(at) or self.is_active_at(at)
 
     def clean(self):
-        if self.starts_at and self.ends_at:
+        if self.event_id and self.starts_at and self.ends_at:
+            # Not from the index, which other processes may have made stale
             other_streams = Stream.objects.filter(
-                starts_at__lt=self.ends_at, ends_at__gt=self.starts_at
-            )
-            if self.pk:
-                other_streams = other_streams.exclude(pk=self.pk)
+                event_id=self.event_id,
+                starts_at__lt=self.ends_at,
+                ends_at__gt=self.starts_at,
+            ).exclude(pk=self.pk)
             if other_streams.exists():
-                raise ValidationError("overlaps with other streams")
+                raise ValidationError(
+                    "overlaps with other streams: %s"
+                    % [str(s) for s in other_streams.select_related("event")]
+                )
+
+    @property
+    def rtmp_url(self):
+        if self.event.rtmp_url:
+            return compile_rtmp_url(self.event.rtmp_url).substitute(
+                id=self.id, key=self.key
+            )
+
+    @property
+    def test_rtmp_url(self):
+        if self.event.test_rtmp_url:
+            return compile_rtmp_url(self.event.test_rtmp_url).substitute(
+                id=self.id, key=self.key
+            )
 
     @property
     def resolved_rtmp_url(self):
         if self.event.rtmp_url:
-            tpl = Template(self.event.resolved_rtmp_url)
-            return tpl.safe_substitute(id=self.id, key=self.key)
+            return self.rtmp_url.resolve()
 
     @property
     def resolved_test_rtmp_url(self):
         if self.event.test_rtmp_url:
-            tpl = Template(self.event.resolved_test_rtmp_url)
-            return tpl.safe_substitute(id=self.id, key=self.key)
-        
+            return self.test_rtmp_url.resolve()
+
     class Meta:
         unique_together = [['event', 'starts_at'], ['event', 'ends_at']]
 
@@ -257,9 +366,85 @@ class StreamNotification(models.Model):
     kind = models.CharField(max_length=2, choices=Kinds.choices)
     sent_at = models.DateTimeField(blank=True, null=True)
 
+    # Outbox: the email is rendered when queued, and delivered by
+    # `events.outbox.deliver_emails` until it is sent or it runs out of attempts
+    recipient = models.EmailField(blank=True)
+    reply_to = models.EmailField(blank=True, null=True)
+    subject = models.CharField(max_length=255, blank=True)
+    body = models.TextField(blank=True)
+    attempts = models.PositiveIntegerField(default=0)
+    next_attempt_at = models.DateTimeField(blank=True, null=True, db_index=True)
+    last_error = models.TextField(blank=True)
+    claimed_by = models.CharField(max_length=32, blank=True, editable=False)
+
     def __str__(self):
         return f"[{self.kind}] {self.stream}"
 
+    class Meta:
+        indexes = [models.Index(fields=["stream", "kind"])]
+        constraints = [
+            # Claims the preparing notification of a stream, so that concurrent
+            # cron runs don't send it twice
+            models.UniqueConstraint(
+                fields=["stream", "kind"],
+                condition=models.Q(kind="PR"),
+                name="unique_stream_preparing_notification",
+            )
+        ]
+
+
+class StreamSession(models.Model):
+    """A period of time a stream was live, from publish until publish done"""
+
+    stream = models.ForeignKey(
+        Stream, on_delete=models.CASCADE, related_name="sessions"
+    )
+    started_at = models.DateTimeField()
+    ended_at = models.DateTimeField(blank=True, null=True)
+    ingest_node = models.CharField(max_length=255, blank=True)
+    redirect_url = models.CharField(max_length=255, blank=True)
+    rolled_up = models.BooleanField(default=False)
+
+    def __str__(self):
+        return f"{self.stream_id}: {self.started_at} - {self.ended_at}"
+
+    @property
+    def duration(self):
+        if self.ended_at:
+            return self.ended_at - self.started_at
+
+    class Meta:
+        indexes = [models.Index(fields=["rolled_up", "ended_at"])]
+
+
+class StreamLiveRollup(models.Model):
+    """Totals of the closed sessions of a stream"""
+
+    stream = models.OneToOneField(
+        Stream, on_delete=models.CASCADE, related_name="live_rollup"
+    )
+    sessions = models.PositiveIntegerField(default=0)
+    live_seconds = models.FloatField(default=0)
+    first_live_at = models.DateTimeField(blank=True, null=True)
+    last_live_at = models.DateTimeField(blank=True, null=True)
+
+    def __str__(self):
+        return f"{self.stream_id}: {self.sessions} sessions, {self.live_seconds}s"
+
+
+class EventLiveRollup(models.Model):
+    """Totals of the closed sessions of all streams of an event"""
+
+    event = models.OneToOneField(
+        Event, on_delete=models.CASCADE, related_name="live_rollup"
+    )
+    sessions = models.PositiveIntegerField(default=0)
+    live_seconds = models.FloatField(default=0)
+    live_streams = models.PositiveIntegerField(default=0)
+
+    def __str__(self):
+        return f"{self.event_id}: {self.sessions} sessions, {self.live_seconds}s"
+
 
 class StreamArchiveURL(models.Model):
     stream = models.ForeignKey(
@@ -272,4 +457,6 @@ class StreamArchiveURL(models.Model):
         return self.url
 
     class Meta:
+        # Listed in the order they were given, see set_archive_urls
+        ordering = ("id",)
         unique_together = ("stream", "url")
@@ -0,0 +1,127 @@
+from datetime import timedelta
+
+from django.core.mail import EmailMessage
+from django.db.models import Exists, OuterRef
+
+from .emails import email_templates, get_subject_template
+from .models import Stream, StreamNotification
+from .outbox import deliver_emails, queue_stream_emails
+from .scheduling import DeadlineScheduler
+from .utils import get_formatted_stream_timeframe, get_formatted_stream_timeframes
+
+# How long before a stream starts its publisher is notified
+PREPARING_NOTICE = timedelta(minutes=10)
+
+PREPARING_SUBJECT = '$event_name: Your stream "$name" is about to start!'
+
+
+def get_streams_to_notify(now, until=None):
+    """Streams starting soon (or until some time) not notified yet"""
+    preparing_notifications = StreamNotification.objects.filter(
+        stream=OuterRef("pk"), kind=StreamNotification.Kinds.PREPARING
+    )
+    return Stream.objects.filter(
+        ~Exists(preparing_notifications),
+        starts_at__lte=until or now + PREPARING_NOTICE,
+        starts_at__gt=now,
+    ).select_related("event")
+
+
+def queue_preparing_emails(streams, now):
+    kind = StreamNotification.Kinds.PREPARING
+    streams = list(streams)
+    timeframes = get_formatted_stream_timeframes(streams)
+    emails = [
+        (stream, kind, build_preparing_email(stream, now, timeframe=timeframe))
+        for stream, timeframe in zip(streams, timeframes)
+    ]
+    # Concurrent runs (e.g. on other nodes) may have queued some of them
+    # already, in which case the unique constraint on PREPARING notifications
+    # skips them
+    queue_stream_emails(emails, ignore_conflicts=True)
+    return len(emails)
+
+
+def build_preparing_email(stream, now, timeframe=None):
+    starts_in = (stream.starts_at - now).seconds // 60
+    starts_at, ends_at = timeframe or get_formatted_stream_timeframe(stream)
+    variables = dict(
+        name=stream.publisher_name,
+        event_name=stream.event.name,
+        starts_at=starts_at,
+        ends_at=ends_at,
+        rtmp_url=stream.event.public_rtmp_url,
+        key=stream.key,
+        contact_email=stream.event.contact_email,
+        starts_in=starts_in,
+        preparation_time=stream.event.preparation_time,
+    )
+
+    body = email_templates.get("stream_preparing").safe_substitute(variables)
+    subject = get_subject_template(PREPARING_SUBJECT).safe_substitute(variables)
+    to = [stream.publisher_email]
+    headers = {"Reply-To": stream.event.contact_email}
+    return EmailMessage(subject, body, None, to, headers=headers)
+
+
+class PreparingNotificationScheduler(DeadlineScheduler):
+    """Notifies publishers exactly `PREPARING_NOTICE` before their streams start
+
+    This replaces polling for streams about to start every minute in
+    `NotifyStreamPreparingJob`.  Streams created or changed by the web workers
+    are picked up from `Stream.updated_at` every `changes_interval` seconds.
+    Only the latest deadline of each stream is kept, so streams seen again by
+    overlapping polls are queued once, and moved streams are not notified at
+    their old deadline.  Deleted streams are left in the queue, and skipped
+    when their deadline comes, as the stream is looked up again before
+    notifying.
+
+    """
+
+    refresh_interval = 3600
+    changes_interval = 10
+    # Streams that should have been notified already are notified right away
+    skip_overdue = False
+    log_name = "NOTIFICATION"
+
+    def __init__(self, deliver_emails=deliver_emails):
+        super().__init__()
+        self.deliver_emails = deliver_emails
+        # Latest deadline of each queued stream, by pk
+        self._deadlines = {}
+
+    def refresh(self, now=None):
+        super().refresh(now)
+        self._deadlines = {pk: at for at, pk in self._heap}
+
+    def schedule(self, at, stream_pk):
+        if self._deadlines.get(stream_pk) == at:
+            return
+        self._deadlines[stream_pk] = at
+        super().schedule(at, stream_pk)
+
+    def is_stale(self, at, stream_pk):
+        return self._deadlines.get(stream_pk) != at
+
+    def get_deadlines(self, now):
+        horizon = now + timedelta(seconds=self.refresh_interval) + PREPARING_NOTICE
+        streams = get_streams_to_notify(now, until=horizon)
+        return self.get_stream_deadlines(streams)
+
+    def get_changes(self, since, now):
+        streams = Stream.objects.filter(updated_at__gte=since, starts_at__gt=now)
+        return self.get_stream_deadlines(streams)
+
+    def get_stream_deadlines(self, streams):
+        for pk, starts_at in streams.values_list("pk", "starts_at"):
+            yield (starts_at - PREPARING_NOTICE, pk)
+
+    def fire(self, stream_pk, now):
+        del self._deadlines[stream_pk]
+        streams = get_streams_to_notify(now).filter(pk=stream_pk)
+        if queue_preparing_emails(streams, now):
+            print(
+                "[NOTIFICATION] Stream %d starts soon. Notify publisher at %s"
+                % (stream_pk, now)
+            )
+            self.deliver_emails()
@@ -0,0 +1,123 @@
+import time
+import uuid
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.mail import EmailMessage
+from django.utils import timezone
+
+from .mailer import BulkMailer
+from .models import StreamNotification
+
+
+def queue_stream_emails(emails, ignore_conflicts=False):
+    """Queue (stream, kind, EmailMessage) tuples for delivery
+
+    Returns the created StreamNotifications, which are delivered later by
+    `deliver_emails`, so that requests don't wait on the SMTP server.  With
+    `ignore_conflicts`, notifications that would break a unique constraint
+    (i.e. already queued) are skipped.
+
+    """
+    now = timezone.now()
+    notifications = [
+        StreamNotification(
+            # The stream of a REMOVED notification is about to be deleted
+            stream=None if kind == StreamNotification.Kinds.REMOVED else stream,
+            kind=kind,
+            recipient=message.to[0],
+            reply_to=message.extra_headers.get("Reply-To"),
+            subject=message.subject[:255],
+            body=message.body,
+            next_attempt_at=now,
+        )
+        for stream, kind, message in emails
+    ]
+    return StreamNotification.objects.bulk_create(
+        notifications, ignore_conflicts=ignore_conflicts
+    )
+
+
+def queue_stream_email(stream, kind, message):
+    return queue_stream_emails([(stream, kind, message)])[0]
+
+
+def get_retry_delay(attempts):
+    """Exponential backoff after a failed attempt"""
+    delay = settings.EMAIL_OUTBOX_RETRY_DELAY * 2 ** (attempts - 1)
+    return timedelta(seconds=min(delay, settings.EMAIL_OUTBOX_MAX_RETRY_DELAY))
+
+
+def claim_emails(now, limit):
+    """Claim up to `limit` pending emails, so that other workers skip them"""
+    token = uuid.uuid4().hex
+    pending = StreamNotification.objects.filter(
+        sent_at__isnull=True, next_attempt_at__lte=now
+    ).order_by("next_attempt_at")
+    pks = list(pending.values_list("pk", flat=True)[:limit])
+    # Only rows still pending are claimed, in case another worker was faster
+    StreamNotification.objects.filter(pk__in=pks, next_attempt_at__lte=now).update(
+        claimed_by=token,
+        next_attempt_at=now + timedelta(seconds=settings.EMAIL_OUTBOX_CLAIM_TIMEOUT),
+    )
+    return list(StreamNotification.objects.filter(claimed_by=token).order_by("pk"))
+
+
+def deliver_emails(limit=100):
+    """Send pending emails, reusing connections (see `BulkMailer`)
+
+    Emails that fail are retried with exponential backoff, up to
+    `EMAIL_OUTBOX_MAX_ATTEMPTS` times.  Returns the number of emails sent and
+    failed.
+
+    """
+    now = timezone.now()
+    notifications = claim_emails(now, limit)
+    if not notifications:
+        return 0, 0
+
+    sent, failed = BulkMailer().send((n.pk, get_message(n)) for n in notifications)
+
+    StreamNotification.objects.filter(pk__in=sent).update(
+        sent_at=timezone.now(), next_attempt_at=None, claimed_by=""
+    )
+    for notification in notifications:
+        err = failed.get(notification.pk)
+        if err is None:
+            continue
+        attempts = notification.attempts + 1
+        if attempts >= settings.EMAIL_OUTBOX_MAX_ATTEMPTS:
+            next_attempt_at = None
+            print(f"[OUTBOX] Giving up on notification {notification.pk}: {err}")
+        else:
+            next_attempt_at = now + get_retry_delay(attempts)
+        StreamNotification.objects.filter(pk=notification.pk).update(
+            attempts=attempts,
+            next_attempt_at=next_attempt_at,
+            last_error=str(err),
+            claimed_by="",
+        )
+    return len(sent), len(failed)
+
+
+def get_message(notification):
+    headers = {}
+    if notification.reply_to:
+        headers["Reply-To"] = notification.reply_to
+    return EmailMessage(
+        notification.subject,
+        notification.body,
+        None,
+        [notification.recipient],
+        headers=headers,
+    )
+
+
+def run_forever(interval=None, sleep=time.sleep):
+    interval = interval or settings.EMAIL_OUTBOX_POLL_INTERVAL
+    while True:
+        sent, failed = deliver_emails()
+        if sent or failed:
+            print(f"[OUTBOX] Sent {sent} emails, {failed} failed")
+        else:
+            sleep(interval)
@@ -2,6 +2,7 @@ from django.conf import settings
 from rest_framework.permissions import BasePermission
 from rest_framework_api_key.permissions import BaseHasAPIKey
 
+from .apikeys import api_key_cache
 from .models import CustomAPIKey
 
 
@@ -12,12 +13,11 @@ class HasCustomAPIKey(BaseHasAPIKey):
         key = self.get_key(request)
         if not key:
             return False
-        is_valid = self.model.objects.is_valid(key)
-        if is_valid:
-            prefix, _, _ = key.partition(".")
-            instance = self.model.objects.get(prefix=prefix)
-            request.is_web = instance.is_web
-        return is_valid
+        api_key = api_key_cache.get(key)
+        if api_key is None or not api_key.is_usable:
+            return False
+        request.is_web = api_key.is_web
+        return True
 
 
 class HasStreamKey(BasePermission):
@@ -0,0 +1,89 @@
+import threading
+import time
+from functools import wraps
+
+from django.conf import settings
+from django.http import HttpResponse
+
+
+class TokenBucketLimiter:
+    """Per-client token bucket rate limiter
+
+    Each client gets up to `RATE_LIMIT_BURST` tokens, refilled at
+    `RATE_LIMIT_RATE` tokens per second, and each request takes one.  Set the
+    rate to 0 to disable rate limiting.
+
+    """
+
+    # Forget about clients with full buckets when tracking more than these
+    max_clients = 10000
+
+    def __init__(self):
+        self._buckets = {}
+        self._lock = threading.Lock()
+        self.limited = 0
+
+    def allow(self, client):
+        rate, burst = settings.RATE_LIMIT_RATE, settings.RATE_LIMIT_BURST
+        if rate <= 0:
+            return True
+
+        now = time.monotonic()
+        with self._lock:
+            tokens, updated_at = self._buckets.get(client, (burst, now))
+            tokens = min(burst, tokens + (now - updated_at) * rate)
+            allowed = tokens >= 1
+            if allowed:
+                tokens -= 1
+            else:
+                self.limited += 1
+            if client not in self._buckets and len(self._buckets) >= self.max_clients:
+                self._purge(now, rate, burst)
+            self._buckets[client] = (tokens, now)
+        return allowed
+
+    def clear(self):
+        with self._lock:
+            self._buckets.clear()
+        self.limited = 0
+
+    def _purge(self, now, rate, burst):
+        for client, (tokens, updated_at) in list(self._buckets.items()):
+            if tokens + (now - updated_at) * rate >= burst:
+                del self._buckets[client]
+
+
+rate_limiter = TokenBucketLimiter()
+
+
+def get_client_address(request):
+    address = request.META.get("REMOTE_ADDR")
+    # nginx sets X-Real-IP when proxying (see tools/nginx), but anyone else
+    # could set it too
+    if address in settings.TRUSTED_PROXIES:
+        return request.META.get("HTTP_X_REAL_IP") or address
+    return address
+
+
+def get_publisher_address(request):
+    # nginx-rtmp sends the address of the publisher in the `addr` field
+    return request.POST.get("addr") or get_client_address(request)
+
+
+def too_many_requests():
+    return HttpResponse("Too many requests", status=429)
+
+
+def rate_limit(get_client):
+    """Reject requests from clients that exceed their rate limit"""
+
+    def decorator(view):
+        @wraps(view)
+        def wrapped_view(request, *args, **kwargs):
+            if not rate_limiter.allow(get_client(request)):
+                return too_many_requests()
+            return view(request, *args, **kwargs)
+
+        return wrapped_view
+
+    return decorator
@@ -0,0 +1,174 @@
+import os
+import threading
+import time
+from fnmatch import fnmatchcase
+from glob import has_magic
+from string import Template
+
+from django.conf import settings
+
+
+class DirectoryListing:
+    __slots__ = ("mtime", "dirs", "files")
+
+    def __init__(self, mtime, dirs, files):
+        self.mtime = mtime
+        self.dirs = dirs
+        self.files = files
+
+
+class RecordingsIndex:
+    """In-memory index of the files under RECORDINGS_ROOT
+
+    Directories are crawled once with `os.scandir`.  Afterwards, at most every
+    `RECORDINGS_INDEX_REFRESH_INTERVAL` seconds, only directories whose mtime
+    changed are listed again.  Files matching RECORDINGS_GLOB_PATTERN for a
+    stream are then looked up in memory, with the same semantics as `glob`,
+    and memoized until some directory changes.
+
+    """
+
+    def __init__(self):
+        self._root = None
+        self._dirs = {}
+        self._matches = {}
+        self._refreshed_at = None
+        self._lock = threading.Lock()
+
+    def paths(self, event_slug, key):
+        """Sorted paths of the recordings of a stream, relative to RECORDINGS_ROOT"""
+        pattern = Template(settings.RECORDINGS_GLOB_PATTERN).safe_substitute(
+            event_slug=event_slug, key=key
+        )
+        with self._lock:
+            self._refresh_if_due()
+            paths = self._matches.get(pattern)
+            if paths is None:
+                paths = self._matches[pattern] = sorted(self._match(pattern))
+        return paths
+
+    def version(self):
+        """Changes whenever a directory changes, i.e. when paths may change
+
+        Made from directory mtimes rather than a counter, so that all processes
+        agree on it.
+
+        """
+        with self._lock:
+            self._refresh_if_due()
+            return "%d.%d" % (
+                len(self._dirs),
+                max((d.mtime or 0 for d in self._dirs.values()), default=0),
+            )
+
+    def rebuild(self):
+        """Crawl RECORDINGS_ROOT from scratch"""
+        with self._lock:
+            self._root = settings.RECORDINGS_ROOT
+            self._dirs = {}
+            self._matches = {}
+            self._scan("")
+            self._refreshed_at = time.monotonic()
+
+    def refresh(self):
+        """List again the directories that changed since last time"""
+        with self._lock:
+            self._refresh()
+
+    def stats(self):
+        return dict(
+            directories=len(self._dirs),
+            files=sum(len(d.files) for d in self._dirs.values()),
+        )
+
+    def _refresh_if_due(self):
+        if self._root != settings.RECORDINGS_ROOT or self._refreshed_at is None:
+            self._root = settings.RECORDINGS_ROOT
+            self._dirs = {}
+            self._matches = {}
+            self._scan("")
+        elif (
+            time.monotonic() - self._refreshed_at
+            >= settings.RECORDINGS_INDEX_REFRESH_INTERVAL
+        ):
+            self._refresh()
+        else:
+            return
+        self._refreshed_at = time.monotonic()
+
+    def _refresh(self):
+        for rel_dir, listing in list(self._dirs.items()):
+            if rel_dir not in self._dirs:
+                # Removed while rescanning its parent
+                continue
+            try:
+                mtime = os.stat(self._abspath(rel_dir)).st_mtime_ns
+            except OSError:
+                mtime = None
+            if mtime != listing.mtime:
+                self._matches = {}
+                self._scan(rel_dir)
+        self._refreshed_at = time.monotonic()
+
+    def _scan(self, rel_dir):
+        """List a directory and crawl its new subdirectories"""
+        previous = self._dirs.pop(rel_dir, None)
+        try:
+            mtime = os.stat(self._abspath(rel_dir)).st_mtime_ns
+            with os.scandir(self._abspath(rel_dir)) as it:
+                entries = list(it)
+        except OSError:
+            entries = None
+
+        if entries is None:
+            self._forget(rel_dir, previous)
+            return
+
+        dirs, files = [], []
+        for entry in entries:
+            (dirs if entry.is_dir() else files).append(entry.name)
+        self._dirs[rel_dir] = DirectoryListing(mtime, dirs, files)
+
+        for name in set(previous.dirs if previous else ()) - set(dirs):
+            sub_dir = os.path.join(rel_dir, name)
+            self._forget(sub_dir, self._dirs.pop(sub_dir, None))
+        for name in dirs:
+            sub_dir = os.path.join(rel_dir, name)
+            if sub_dir not in self._dirs:
+                self._scan(sub_dir)
+
+    def _forget(self, rel_dir, listing):
+        for name in listing.dirs if listing else ():
+            sub_dir = os.path.join(rel_dir, name)
+            self._forget(sub_dir, self._dirs.pop(sub_dir, None))
+
+    def _match(self, pattern):
+        segments = [s for s in pattern.split("/") if s]
+        candidates = [""]
+        for i, segment in enumerate(segments):
+            is_last = i == len(segments) - 1
+            matches = []
+            for rel_dir in candidates:
+                listing = self._dirs.get(rel_dir)
+                if listing is None:
+                    continue
+                names = listing.dirs + listing.files if is_last else listing.dirs
+                if has_magic(segment):
+                    # Like glob, wildcards don't match hidden files
+                    names = [
+                        n
+                        for n in names
+                        if fnmatchcase(n, segment)
+                        and (segment.startswith(".") or not n.startswith("."))
+                    ]
+                else:
+                    names = [segment] if segment in names else []
+                matches.extend(os.path.join(rel_dir, n) for n in names)
+            candidates = matches
+        return candidates
+
+    def _abspath(self, rel_dir):
+        return os.path.join(self._root, rel_dir)
+
+
+recordings_index = RecordingsIndex()
@@ -0,0 +1,149 @@
+import asyncio
+import socket
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+
+
+class Resolution:
+    __slots__ = ("address", "error", "resolved_at")
+
+    def __init__(self, address=None, error=None):
+        self.address = address
+        self.error = error
+        self.resolved_at = time.monotonic()
+
+    @property
+    def ttl(self):
+        if self.error:
+            return settings.DNS_CACHE_NEGATIVE_TTL
+        return settings.DNS_CACHE_TTL
+
+    @property
+    def age(self):
+        return time.monotonic() - self.resolved_at
+
+    def result(self):
+        if self.error:
+            # Raise a copy, so that tracebacks don't pile up on the cached error
+            raise type(self.error)(*self.error.args)
+        return self.address
+
+
+class HostResolver:
+    """Caching replacement for `socket.gethostbyname`
+
+    Successful resolutions are cached for `DNS_CACHE_TTL` seconds and failed
+    ones for `DNS_CACHE_NEGATIVE_TTL` seconds.  Once expired, entries younger
+    than `DNS_CACHE_STALE_TTL` more seconds are still returned while they are
+    refreshed in a background thread, so that callers only block on the
+    resolver the first time a host is looked up.
+
+    """
+
+    def __init__(self):
+        self._entries = {}
+        self._refreshing = set()
+        self._lock = threading.Lock()
+        self._executor = None
+        self.hits = 0
+        self.stale_hits = 0
+        self.misses = 0
+        self.lookups = 0
+        self.lookup_time = 0.0
+        self.max_lookup_time = 0.0
+
+    def gethostbyname(self, host):
+        entry = self._get_cached(host)
+        if entry is None:
+            entry = self._resolve(host)
+        return entry.result()
+
+    async def agethostbyname(self, host):
+        """Like `gethostbyname`, but resolves in a thread without blocking the loop"""
+        entry = self._get_cached(host)
+        if entry is None:
+            loop = asyncio.get_running_loop()
+            entry = await loop.run_in_executor(
+                self._get_executor(), self._resolve, host
+            )
+        return entry.result()
+
+    def refresh(self, host):
+        """Resolve host again in the background, if not already doing so"""
+        with self._lock:
+            if host in self._refreshing:
+                return
+            self._refreshing.add(host)
+        self._get_executor().submit(self._refresh, host)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+        self.hits = self.stale_hits = self.misses = 0
+        self.lookups = 0
+        self.lookup_time = self.max_lookup_time = 0.0
+
+    def stats(self):
+        return dict(
+            size=len(self._entries),
+            hits=self.hits,
+            stale_hits=self.stale_hits,
+            misses=self.misses,
+            lookups=self.lookups,
+            avg_lookup_time=self.lookups and self.lookup_time / self.lookups,
+            max_lookup_time=self.max_lookup_time,
+        )
+
+    def _get_cached(self, host):
+        entry = self._entries.get(host)
+        if entry is not None:
+            age = entry.age
+            if age < entry.ttl:
+                self.hits += 1
+                return entry
+            if age < entry.ttl + settings.DNS_CACHE_STALE_TTL:
+                self.stale_hits += 1
+                self.refresh(host)
+                return entry
+        self.misses += 1
+        return None
+
+    def _get_executor(self):
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(
+                    max_workers=2, thread_name_prefix="muxy-resolver"
+                )
+            return self._executor
+
+    def _refresh(self, host):
+        try:
+            self._resolve(host, keep_stale=True)
+        finally:
+            with self._lock:
+                self._refreshing.discard(host)
+
+    def _resolve(self, host, keep_stale=False):
+        start = time.monotonic()
+        try:
+            entry = Resolution(address=socket.gethostbyname(host))
+        except OSError as err:
+            entry = Resolution(error=err)
+        elapsed = time.monotonic() - start
+
+        with self._lock:
+            self.lookups += 1
+            self.lookup_time += elapsed
+            self.max_lookup_time = max(self.max_lookup_time, elapsed)
+            # A failed refresh should not replace a previously resolved address
+            # while it can still be served as stale.
+            previous = self._entries.get(host)
+            if not (keep_stale and entry.error and previous and not previous.error):
+                self._entries[host] = entry
+        return entry
+
+
+resolver = HostResolver()
@@ -0,0 +1,62 @@
+import threading
+from contextlib import contextmanager
+from hashlib import sha1
+
+from django.db.models import F, Q
+
+from .models import Event, Stream
+
+_deferred = threading.local()
+
+
+def bump_event_revisions(event_ids):
+    """Mark events as changed, so that ETags of their API responses change
+
+    `event_ids` may also be a subquery.  Revisions are incremented in the
+    database, so that changes made by any process are seen by all of them.
+
+    """
+    if getattr(_deferred, "event_ids", None) is not None:
+        _deferred.event_ids.update(event_ids)
+        return
+    Event.objects.filter(pk__in=event_ids).update(revision=F("revision") + 1)
+
+
+def bump_stream_event_revisions(stream_ids):
+    """Mark the events of some streams as changed"""
+    if getattr(_deferred, "stream_ids", None) is not None:
+        _deferred.stream_ids.update(stream_ids)
+        return
+    bump_event_revisions(Stream.objects.filter(pk__in=stream_ids).values("event_id"))
+
+
+@contextmanager
+def deferred_revision_bumps():
+    """Bump each event changed within the block once, at its end
+
+    e.g. when deleting many rows, which sends `post_delete` for each of them.
+
+    """
+    if getattr(_deferred, "event_ids", None) is not None:
+        # Already deferred by an outer block
+        yield
+        return
+    _deferred.event_ids, _deferred.stream_ids = set(), set()
+    try:
+        yield
+        event_ids, stream_ids = _deferred.event_ids, _deferred.stream_ids
+    finally:
+        _deferred.event_ids = _deferred.stream_ids = None
+    if event_ids or stream_ids:
+        stream_event_ids = Stream.objects.filter(pk__in=stream_ids).values("event_id")
+        Event.objects.filter(
+            Q(pk__in=event_ids) | Q(pk__in=stream_event_ids)
+        ).update(revision=F("revision") + 1)
+
+
+def make_etag(variant, revisions):
+    """ETag of a response variant, from the (event id, revision) pairs shown"""
+    digest = sha1(variant.encode())
+    for pk, revision in sorted(revisions):
+        digest.update(b"%d:%d," % (pk, revision))
+    return '"%s"' % digest.hexdigest()
@@ -0,0 +1,75 @@
+from collections import defaultdict
+
+from django.db import transaction
+from django.db.models import Count, Sum
+
+from .models import EventLiveRollup, StreamLiveRollup, StreamSession
+
+
+@transaction.atomic
+def rollup_live_sessions():
+    """Add closed sessions that were not rolled up yet to stream and event totals
+
+    Returns the number of sessions rolled up.
+
+    """
+    sessions = list(
+        StreamSession.objects.select_for_update()
+        .filter(rolled_up=False, ended_at__isnull=False)
+        .values_list("pk", "stream_id", "stream__event_id", "started_at", "ended_at")
+    )
+    if not sessions:
+        return 0
+
+    event_ids = set()
+    by_stream = defaultdict(list)
+    for _, stream_id, event_id, started_at, ended_at in sessions:
+        event_ids.add(event_id)
+        by_stream[stream_id].append((started_at, ended_at))
+
+    rollups = StreamLiveRollup.objects.in_bulk(by_stream, field_name="stream_id")
+    new_rollups = []
+    for stream_id, periods in by_stream.items():
+        rollup = rollups.get(stream_id)
+        if rollup is None:
+            rollup = StreamLiveRollup(stream_id=stream_id)
+            new_rollups.append(rollup)
+        first_live_at = min(start for start, _ in periods)
+        last_live_at = max(end for _, end in periods)
+        rollup.sessions += len(periods)
+        rollup.live_seconds += sum(
+            (end - start).total_seconds() for start, end in periods
+        )
+        rollup.first_live_at = min(filter(None, (rollup.first_live_at, first_live_at)))
+        rollup.last_live_at = max(filter(None, (rollup.last_live_at, last_live_at)))
+
+    StreamLiveRollup.objects.bulk_create(new_rollups)
+    StreamLiveRollup.objects.bulk_update(
+        list(rollups.values()),
+        ["sessions", "live_seconds", "first_live_at", "last_live_at"],
+    )
+
+    # Event totals are recomputed from the (small) stream totals table
+    totals = (
+        StreamLiveRollup.objects.filter(stream__event_id__in=event_ids)
+        .values("stream__event_id")
+        .annotate(
+            total_sessions=Sum("sessions"),
+            total_live_seconds=Sum("live_seconds"),
+            total_live_streams=Count("pk"),
+        )
+    )
+    for total in totals:
+        EventLiveRollup.objects.update_or_create(
+            event_id=total["stream__event_id"],
+            defaults=dict(
+                sessions=total["total_sessions"],
+                live_seconds=total["total_live_seconds"],
+                live_streams=total["total_live_streams"],
+            ),
+        )
+
+    StreamSession.objects.filter(pk__in=[s[0] for s in sessions]).update(
+        rolled_up=True
+    )
+    return len(sessions)
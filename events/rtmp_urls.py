@@ -0,0 +1,27 @@
+"""URL configuration of the nginx-rtmp callbacks
+
+It is included by `events.urls`, and it is also the root URLconf of the lean
+callbacks application (see `muxy.settings_rtmp`).  When RTMP_CALLBACKS_ASYNC
+is set, the asynchronous versions of the callbacks are used.
+
+"""
+from django.conf import settings
+from django.urls import path
+from django.views.decorators.csrf import csrf_exempt
+
+from events import async_views, views
+
+if settings.RTMP_CALLBACKS_ASYNC:
+    on_publish = async_views.on_publish
+    on_publish_done = async_views.on_publish_done
+    on_update = async_views.on_update
+else:
+    on_publish = csrf_exempt(views.on_publish)
+    on_publish_done = csrf_exempt(views.on_publish_done)
+    on_update = csrf_exempt(views.on_update)
+
+urlpatterns = [
+    path('rtmp/on-publish/', on_publish, name='on-publish'),
+    path('rtmp/on-publish-done/', on_publish_done, name='on-publish-done'),
+    path('rtmp/on-update/', on_update, name='on-update'),
+]
@@ -0,0 +1,125 @@
+import heapq
+import time
+from datetime import timedelta
+
+from django.db import DatabaseError
+from django.utils import timezone
+
+
+class DeadlineScheduler:
+    """Fires actions at given times, kept in a time-ordered heap
+
+    Subclasses implement `get_deadlines`, which returns (at, item) pairs for
+    the upcoming deadlines, and `fire`, which is called with each item once its
+    time comes.  As they usually run in their own process, where model signals
+    from the web workers are not received, deadlines are reloaded every
+    `refresh_interval` seconds.  Subclasses may also implement `get_changes`,
+    polled every `changes_interval` seconds, to pick up changes in between.
+
+    """
+
+    refresh_interval = 60
+    changes_interval = None
+    # Seconds to wait before trying again after a database error
+    retry_interval = 10
+    # Prefix of logged errors
+    log_name = "SCHEDULER"
+    # Whether deadlines already passed when (re)loaded are dropped, or fired
+    skip_overdue = True
+
+    def __init__(self):
+        self._heap = []
+
+    def get_deadlines(self, now):
+        raise NotImplementedError
+
+    def fire(self, item, now):
+        raise NotImplementedError
+
+    def get_changes(self, since, now):
+        """Deadlines of items changed since some time, as (at, item) pairs"""
+        return ()
+
+    def refresh(self, now=None):
+        now = now or timezone.now()
+        self._heap = [
+            (at, item)
+            for at, item in self.get_deadlines(now)
+            if at > now or not self.skip_overdue
+        ]
+        heapq.heapify(self._heap)
+
+    def poll_changes(self, since, now=None):
+        now = now or timezone.now()
+        for at, item in self.get_changes(since, now):
+            # Deadlines passed since the change are still fired, as they
+            # could not have been scheduled before
+            if at > since or not self.skip_overdue:
+                self.schedule(at, item)
+
+    def schedule(self, at, item):
+        heapq.heappush(self._heap, (at, item))
+
+    def is_stale(self, at, item):
+        """Whether a deadline was replaced by another since it was scheduled"""
+        return False
+
+    @property
+    def next_deadline(self):
+        if self._heap:
+            return self._heap[0][0]
+
+    def run_pending(self, now=None):
+        """Fire all items whose deadline has passed, and return them"""
+        now = now or timezone.now()
+        fired, seen = [], set()
+        while self._heap and self._heap[0][0] <= now:
+            at, item = heapq.heappop(self._heap)
+            if item in seen or self.is_stale(at, item):
+                continue
+            seen.add(item)
+            try:
+                self.fire(item, now)
+            except (OSError, DatabaseError) as err:
+                # Keep going with the other items
+                print("[%s] Could not fire %s: %s" % (self.log_name, item, err))
+                continue
+            fired.append(item)
+        return fired
+
+    def run_forever(self, sleep=time.sleep):
+        next_refresh = next_changes = changes_since = None
+        while True:
+            now = timezone.now()
+            self.run_pending(now)
+            retry_at = now + timedelta(seconds=self.retry_interval)
+            if next_refresh is None or next_refresh <= now:
+                try:
+                    self.refresh(now)
+                except DatabaseError as err:
+                    print("[%s] Could not load deadlines: %s" % (self.log_name, err))
+                    next_refresh = retry_at
+                else:
+                    next_refresh = now + timedelta(seconds=self.refresh_interval)
+                    changes_since = now
+            if (
+                self.changes_interval
+                and changes_since is not None
+                and (next_changes is None or next_changes <= now)
+            ):
+                # Overlap polls, as rows may be committed a while after their
+                # change time
+                interval = timedelta(seconds=self.changes_interval)
+                try:
+                    self.poll_changes(changes_since - interval, now)
+                except DatabaseError as err:
+                    print("[%s] Could not poll changes: %s" % (self.log_name, err))
+                    next_changes = retry_at
+                else:
+                    next_changes = now + interval
+                    changes_since = now
+
+            wake_at = min(
+                filter(None, (self.next_deadline, next_refresh, next_changes))
+            )
+            sleep(max((wake_at - timezone.now()).total_seconds(), 0))
@@ -1,8 +1,22 @@
+from datetime import datetime, timedelta
+
 from rest_framework import serializers
-from django.db import transaction
+from django.db import IntegrityError, transaction
+from django.db.models import Q
+from django.utils import timezone
 
 from events.models import (Event, EventStreamURL, EventSupportURL, Stream,
                            StreamArchiveURL)
+from events.revisions import deferred_revision_bumps
+from events.signals import streams_bulk_saved
+from events.slots import slot_index
+
+# Saved streams checked for overlaps by each query, as SQLite limits how
+# deeply conditions may be nested
+OVERLAP_CHECK_BATCH_SIZE = 100
+
+# Times of streams being moved in bulk, unique by stream id
+CLEARED_SLOT_TIME = datetime(1970, 1, 1, tzinfo=timezone.utc)
 
 
 class EventStreamURLSerializer(serializers.HyperlinkedModelSerializer):
@@ -25,7 +39,8 @@ class EventSerializer(serializers.HyperlinkedModelSerializer):
 
     class Meta:
         model = Event
-        fields = "__all__"
+        # Only used for ETags, see events.revisions
+        exclude = ("revision",)
 
     def validate(self, attrs):
         starts_at = attrs.get("starts_at")
@@ -49,7 +64,7 @@ class EventSerializer(serializers.HyperlinkedModelSerializer):
 class PublicEventSerializer(EventSerializer):
     class Meta:
         model = Event
-        exclude = ("rtmp_url",)
+        exclude = ("rtmp_url", "revision")
 
 
 class StreamArchiveURLSerializer(serializers.HyperlinkedModelSerializer):
@@ -58,6 +73,106 @@ class StreamArchiveURLSerializer(serializers.HyperlinkedModelSerializer):
         fields = ("url", "name")
 
 
+def get_overlapping_streams(streams):
+    """Other streams overlapping any of some saved streams"""
+    overlaps = Q()
+    for stream in streams:
+        overlaps |= Q(
+            event_id=stream.event_id,
+            starts_at__lt=stream.ends_at,
+            ends_at__gt=stream.starts_at,
+        ) & ~Q(pk=stream.pk)
+    return Stream.objects.filter(overlaps)
+
+
+def check_saved_stream_overlaps(streams):
+    """Ensure streams just written don't overlap others
+
+    Validation only reads the slot index of this process, which may miss
+    streams saved by other processes.  This runs within the saving
+    transaction, after the writes, with an indexed EXISTS query per
+    `OVERLAP_CHECK_BATCH_SIZE` streams: as SQLite lets a single transaction
+    write at a time, concurrent saves of overlapping streams can't both get
+    through.  Overlaps are then described from the slot index if it has them.
+
+    """
+    streams = list(streams)
+    pks = {stream.pk for stream in streams}
+    for i in range(0, len(streams), OVERLAP_CHECK_BATCH_SIZE):
+        batch = streams[i : i + OVERLAP_CHECK_BATCH_SIZE]
+        if not get_overlapping_streams(batch).exists():
+            continue
+        for stream in batch:
+            # Slots of streams saved along are where they used to be
+            other_slots = [
+                slot
+                for slot in slot_index.overlapping(
+                    stream.event_id, stream.starts_at, stream.ends_at
+                )
+                if slot.pk not in pks
+            ]
+            if other_slots:
+                break
+        else:
+            # Saved by other processes since the index was loaded
+            other_slots = get_overlapping_streams(batch).select_related("event")
+        events_str = [str(s) for s in other_slots]
+        raise serializers.ValidationError(
+            "overlaps with other streams: %s" % events_str
+        )
+
+
+def set_archive_urls(streams_archive_urls):
+    """Replace the archive URLs of streams, writing only what changed
+
+    `streams_archive_urls` maps saved streams to their new archive URLs data.
+    Current URLs are fetched with a single query, then removed, renamed or
+    added URLs are written in bulk, so unchanged lists cost no writes.
+    Archive URLs are listed by id, so current URLs are only kept while they
+    come in the requested order: the others are created again after them.
+
+    """
+    wanted = {
+        stream.pk: [(d["url"], d.get("name", "")) for d in archive_urls]
+        for stream, archive_urls in streams_archive_urls.items()
+    }
+    current = {stream_id: [] for stream_id in wanted}
+    for archive_url in StreamArchiveURL.objects.filter(
+        stream_id__in=list(wanted)
+    ).order_by("pk"):
+        current[archive_url.stream_id].append(archive_url)
+
+    removed, renamed, added = [], [], []
+    for stream_id, archive_urls in wanted.items():
+        urls = {url for url, _ in archive_urls}
+        kept = 0
+        for archive_url in current[stream_id]:
+            if archive_url.url not in urls:
+                removed.append(archive_url.pk)
+            elif kept < len(archive_urls) and archive_url.url == archive_urls[kept][0]:
+                name = archive_urls[kept][1]
+                if archive_url.name != name:
+                    archive_url.name = name
+                    renamed.append(archive_url)
+                kept += 1
+            else:
+                # Out of order, so created again below
+                removed.append(archive_url.pk)
+        added += [
+            StreamArchiveURL(stream_id=stream_id, url=url, name=name)
+            for url, name in archive_urls[kept:]
+        ]
+
+    if removed:
+        # Bumps the revision of each event once, not once per row
+        with deferred_revision_bumps():
+            StreamArchiveURL.objects.filter(pk__in=removed).delete()
+    if renamed:
+        StreamArchiveURL.objects.bulk_update(renamed, ["name"])
+    if added:
+        StreamArchiveURL.objects.bulk_create(added)
+
+
 class StreamSerializer(serializers.HyperlinkedModelSerializer):
     recordings = serializers.SerializerMethodField()
     key = serializers.CharField(required=False)
@@ -65,52 +180,254 @@ class StreamSerializer(serializers.HyperlinkedModelSerializer):
 
     class Meta:
         model = Stream
-        fields = "__all__"
+        # Only used by the notification scheduler
+        exclude = ("updated_at",)
 
     @transaction.atomic
     def create(self, validated_data):
         archive_urls_data = validated_data.pop('archive_urls', [])
         stream = Stream.objects.create(**validated_data)
-        for archive_url_data in archive_urls_data:
-            StreamArchiveURL.objects.create(stream=stream, **archive_url_data)
+        check_saved_stream_overlaps([stream])
+        StreamArchiveURL.objects.bulk_create(
+            StreamArchiveURL(stream=stream, **archive_url_data)
+            for archive_url_data in archive_urls_data
+        )
         return stream
 
     @transaction.atomic
     def update(self, instance, validated_data):
-        archive_urls_data = validated_data.pop('archive_urls', [])
+        archive_urls_data = validated_data.pop('archive_urls', None)
+        if archive_urls_data is None and not self.partial:
+            archive_urls_data = []
         instance = super().update(instance, validated_data)
-        instance.archive_urls.all().delete()
-        for archive_url_data in archive_urls_data:
-            instance.archive_urls.create(**archive_url_data)
+        if {"event", "starts_at", "ends_at"} & set(validated_data):
+            check_saved_stream_overlaps([instance])
+        # Partial updates without archive URLs leave them as they are
+        if archive_urls_data is not None:
+            set_archive_urls({instance: archive_urls_data})
         return instance
 
     def get_recordings(self, stream):
         request = self.context.get("request")
         return [request.build_absolute_uri(path) for path in stream.recording_paths]
 
+    def validate_archive_urls(self, value):
+        urls = [d["url"] for d in value]
+        if len(urls) != len(set(urls)):
+            raise serializers.ValidationError("duplicate archive URLs")
+        return value
+
     def validate(self, attrs):
         starts_at = attrs.get("starts_at")
         ends_at = attrs.get("ends_at")
-        key = attrs.get("key")
 
         if starts_at and ends_at:
-            other_streams = Stream.objects.filter(
-                event=attrs["event"],
-                starts_at__lt=attrs["ends_at"],
-                ends_at__gt=attrs["starts_at"],
-            )
-            if self.instance:
-                other_streams = other_streams.exclude(pk=self.instance.pk)
-            if key:
-                other_streams = other_streams.exclude(key=attrs["key"])
-            if other_streams.exists():
-                events_str = [str(s) for s in other_streams.all()]
+            other_slots = self.get_overlapping_slots(attrs)
+            if other_slots:
+                # The index may be stale, so make sure they are still there
+                # before reporting them
+                other_pks = set(
+                    Stream.objects.filter(
+                        pk__in=[s.pk for s in other_slots],
+                        starts_at__lt=ends_at,
+                        ends_at__gt=starts_at,
+                    ).values_list("pk", flat=True)
+                )
+                other_slots = [s for s in other_slots if s.pk in other_pks]
+            if other_slots:
+                events_str = [str(s) for s in other_slots]
                 raise serializers.ValidationError(
                     "overlaps with other streams: %s" % events_str
                 )
 
         return attrs
 
+    def get_overlapping_slots(self, attrs):
+        return slot_index.overlapping(
+            attrs["event"].pk,
+            attrs["starts_at"],
+            attrs["ends_at"],
+            exclude_pk=self.instance.pk if self.instance else None,
+            exclude_key=attrs.get("key"),
+        )
+
+
+class CachedHyperlinkedRelatedField(serializers.HyperlinkedRelatedField):
+    """Hyperlinked field that looks up each URL once, e.g. in bulk requests"""
+
+    def get_object(self, view_name, view_args, view_kwargs):
+        if not hasattr(self, "_objects"):
+            self._objects = {}
+        lookup = (view_name, tuple(view_args), tuple(sorted(view_kwargs.items())))
+        if lookup not in self._objects:
+            self._objects[lookup] = super().get_object(
+                view_name, view_args, view_kwargs
+            )
+        return self._objects[lookup]
+
+
+class BulkStreamListSerializer(serializers.ListSerializer):
+    """Creates streams, or updates those with an existing key, in bulk
+
+    The whole batch is validated against the event timelines and among
+    itself, then written with `bulk_create`/`bulk_update`.  As these don't send
+    `post_save`, `streams_bulk_saved` is sent instead (see `events.signals`).
+
+    """
+
+    def to_internal_value(self, data):
+        # Streams updated in this batch may be moved away from their slots, so
+        # they are only checked against the rest of the batch
+        items = data if isinstance(data, list) else []
+        self.keys = {i.get("key") for i in items if isinstance(i, dict)} - {None}
+        return super().to_internal_value(data)
+
+    def validate(self, attrs):
+        keys = [a["key"] for a in attrs if a.get("key")]
+        if len(keys) != len(set(keys)):
+            raise serializers.ValidationError("duplicate stream keys")
+
+        slots = sorted(
+            (a for a in attrs if a.get("starts_at") and a.get("ends_at")),
+            key=lambda a: (a["event"].pk, a["starts_at"]),
+        )
+        for previous, current in zip(slots, slots[1:]):
+            if (
+                previous["event"] == current["event"]
+                and current["starts_at"] < previous["ends_at"]
+            ):
+                raise serializers.ValidationError(
+                    "overlapping streams: %s (%s - %s) and %s (%s - %s)"
+                    % (
+                        previous["publisher_name"],
+                        previous["starts_at"],
+                        previous["ends_at"],
+                        current["publisher_name"],
+                        current["starts_at"],
+                        current["ends_at"],
+                    )
+                )
+        return attrs
+
+    def create(self, validated_data):
+        try:
+            with transaction.atomic():
+                return self.save_streams(validated_data)
+        except IntegrityError:
+            # e.g. the same start or end time as a stream saved meanwhile, or
+            # missing from the slot index of this process
+            raise serializers.ValidationError(
+                "conflicts with streams saved meanwhile, please try again"
+            )
+
+    def save_streams(self, validated_data):
+        keys = [d["key"] for d in validated_data if d.get("key")]
+        existing = Stream.objects.in_bulk(keys, field_name="key")
+        previous_event_ids = {s.event_id for s in existing.values()}
+
+        streams, created, updated, update_fields = [], [], [], set()
+        moved, archive_urls_data = [], {}
+        for data in validated_data:
+            data = dict(data)
+            archive_urls = data.pop("archive_urls", None)
+            stream = existing.get(data.get("key"))
+            if stream is None:
+                stream = Stream(**data)
+                created.append(stream)
+            else:
+                slot = (stream.event_id, stream.starts_at, stream.ends_at)
+                for attr, value in data.items():
+                    setattr(stream, attr, value)
+                if (stream.event_id, stream.starts_at, stream.ends_at) != slot:
+                    moved.append(stream)
+                update_fields.update(data)
+                updated.append(stream)
+            if archive_urls is not None:
+                archive_urls_data[stream.key] = archive_urls
+            streams.append(stream)
+
+        if updated:
+            # bulk_update does not set auto_now fields
+            now = timezone.now()
+            for stream in updated:
+                stream.updated_at = now
+            update_fields.discard("key")
+            update_fields.add("updated_at")
+            if len(moved) > 1:
+                self.clear_slots(moved)
+                update_fields.update(["starts_at", "ends_at"])
+            Stream.objects.bulk_update(updated, list(update_fields))
+        if created:
+            Stream.objects.bulk_create(created)
+            # SQLite does not return the ids of rows created in bulk
+            pks = dict(
+                Stream.objects.filter(
+                    key__in=[s.key for s in created]
+                ).values_list("key", "pk")
+            )
+            for stream in created:
+                stream.pk = pks[stream.key]
+        check_saved_stream_overlaps(streams)
+
+        if archive_urls_data:
+            set_archive_urls(
+                {
+                    stream: archive_urls_data[stream.key]
+                    for stream in streams
+                    if stream.key in archive_urls_data
+                }
+            )
+
+        self.created = created
+        streams_bulk_saved.send(
+            sender=Stream,
+            created=created,
+            updated=updated,
+            previous_event_ids=previous_event_ids,
+        )
+        return streams
+
+    def clear_slots(self, streams):
+        """Move streams out of the way before moving them to their new slots
+
+        The unique constraints on start and end times are checked row by row,
+        so streams moved onto each other's times (e.g. when shifting a
+        schedule) would otherwise collide with those not moved yet.
+
+        """
+        slots = [(s.starts_at, s.ends_at) for s in streams]
+        for stream in streams:
+            stream.starts_at = stream.ends_at = CLEARED_SLOT_TIME - timedelta(
+                microseconds=stream.pk
+            )
+        Stream.objects.bulk_update(streams, ["starts_at", "ends_at"])
+        for stream, (starts_at, ends_at) in zip(streams, slots):
+            stream.starts_at, stream.ends_at = starts_at, ends_at
+
+
+class BulkStreamSerializer(StreamSerializer):
+    event = CachedHyperlinkedRelatedField(
+        view_name="event-detail", queryset=Event.objects.all()
+    )
+
+    class Meta(StreamSerializer.Meta):
+        list_serializer_class = BulkStreamListSerializer
+
+    def get_overlapping_slots(self, attrs):
+        batch_keys = getattr(self.parent, "keys", ())
+        return [
+            slot
+            for slot in super().get_overlapping_slots(attrs)
+            if slot.key not in batch_keys
+        ]
+
+    def get_validators(self):
+        # Same start or end times in an event are already reported as
+        # overlaps, without a query per stream (which would not know about
+        # streams updated by key either).  Those the slot index misses are
+        # reported when writing them, see BulkStreamListSerializer.create
+        return []
+
 
 class PublicStreamSerializer(StreamSerializer):
     recordings = None
@@ -118,4 +435,4 @@ class PublicStreamSerializer(StreamSerializer):
 
     class Meta:
         model = Stream
-        exclude = ("key", "publisher_email")
+        exclude = ("key", "publisher_email", "updated_at")
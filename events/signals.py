@@ -1,14 +1,131 @@
-import os
-from string import Template
+from urllib.parse import urlparse
 
-from django.apps import apps
 from django.core.mail import EmailMessage
-from django.db.models.signals import post_save, post_delete
-from django.dispatch import receiver
-from django.utils import timezone
+from django.db import transaction
+from django.db.models.signals import post_save, post_delete, pre_save
+from django.dispatch import Signal, receiver
+
+from .apikeys import api_key_cache
+from .cache import schedule_cache
+from .emails import email_templates, get_subject_template
+from .keyfilter import key_filter
+from .models import (
+    CustomAPIKey,
+    Event,
+    EventStreamURL,
+    EventSupportURL,
+    Stream,
+    StreamArchiveURL,
+    StreamNotification,
+)
+from .outbox import queue_stream_email, queue_stream_emails
+from .resolver import resolver
+from .revisions import bump_event_revisions, bump_stream_event_revisions
+from .slots import slot_index
+from .utils import (
+    get_formatted_stream_timeframe,
+    get_formatted_stream_timeframes,
+    get_support_channels_test,
+    get_support_channels_texts,
+)
+
+# Sent with `created` and `updated` lists of streams after they are saved with
+# bulk_create/bulk_update, which don't send post_save, and the
+# `previous_event_ids` of the updated streams
+streams_bulk_saved = Signal()
+
+
+@receiver(post_save, sender=CustomAPIKey)
+@receiver(post_delete, sender=CustomAPIKey)
+def invalidate_api_key(sender, instance, **kwargs):
+    api_key_cache.invalidate(instance)
 
-from .models import Stream, StreamNotification
-from .utils import get_formatted_stream_timeframe, get_support_channels_test
+
+@receiver(post_save, sender=Stream)
+@receiver(post_delete, sender=Stream)
+def invalidate_stream_schedule(sender, instance, **kwargs):
+    schedule_cache.invalidate_stream(instance)
+
+
+@receiver(post_save, sender=Stream)
+def add_stream_key_to_filter(sender, instance, **kwargs):
+    key_filter.add(instance.key)
+
+
+@receiver(post_save, sender=Stream)
+def update_stream_slot(sender, instance, **kwargs):
+    # Not before commit, a rolled back save would leave a phantom slot
+    transaction.on_commit(lambda: slot_index.update_stream(instance))
+
+
+@receiver(post_delete, sender=Stream)
+def remove_stream_slot(sender, instance, **kwargs):
+    # The instance has no pk anymore by then
+    pk = instance.pk
+    transaction.on_commit(lambda: slot_index.remove_stream(pk))
+
+
+@receiver(streams_bulk_saved, sender=Stream)
+def update_bulk_saved_streams(sender, created, updated, **kwargs):
+    for stream in updated:
+        schedule_cache.invalidate_stream(stream)
+    for stream in created:
+        key_filter.add(stream.key)
+    # Not before commit, a failed batch would leave phantom slots
+    transaction.on_commit(lambda: slot_index.update_streams(created + updated))
+
+
+@receiver(post_save, sender=Event)
+@receiver(post_delete, sender=Event)
+def invalidate_event_schedules(sender, instance, **kwargs):
+    schedule_cache.invalidate_event(instance)
+    slot_index.invalidate_event(instance)
+
+
+@receiver(post_save, sender=Event)
+@receiver(post_save, sender=Stream)
+@receiver(post_delete, sender=Stream)
+@receiver(post_save, sender=EventStreamURL)
+@receiver(post_delete, sender=EventStreamURL)
+@receiver(post_save, sender=EventSupportURL)
+@receiver(post_delete, sender=EventSupportURL)
+def bump_event_revision(sender, instance, **kwargs):
+    bump_event_revisions([instance.pk if sender is Event else instance.event_id])
+
+
+@receiver(pre_save, sender=Stream)
+def bump_previous_event_revision(sender, instance, **kwargs):
+    # A stream moved to another event also changes the one it leaves
+    if instance.pk is not None:
+        bump_event_revisions(
+            Stream.objects.filter(pk=instance.pk)
+            .exclude(event_id=instance.event_id)
+            .values("event_id")
+        )
+
+
+@receiver(post_save, sender=StreamArchiveURL)
+@receiver(post_delete, sender=StreamArchiveURL)
+def bump_stream_event_revision(sender, instance, **kwargs):
+    bump_stream_event_revisions([instance.stream_id])
+
+
+@receiver(streams_bulk_saved, sender=Stream)
+def bump_bulk_saved_event_revisions(
+    sender, created, updated, previous_event_ids=(), **kwargs
+):
+    bump_event_revisions(
+        {s.event_id for s in created + updated} | set(previous_event_ids)
+    )
+
+
+@receiver(post_save, sender=Event)
+def prefetch_event_rtmp_hosts(sender, instance, **kwargs):
+    # Resolve hosts in the background, so redirects don't wait for the resolver
+    for url in (instance.rtmp_url, instance.test_rtmp_url):
+        host = url and urlparse(url).hostname
+        if host:
+            resolver.refresh(host)
 
 
 @receiver(post_save, sender=Stream)
@@ -35,9 +152,34 @@ def send_stream_destroy_email(sender, instance, **kwargs):
     )
 
 
+@receiver(streams_bulk_saved, sender=Stream)
+def send_bulk_created_stream_emails(sender, created, **kwargs):
+    if created:
+        send_stream_create_emails(created)
+
+
 def send_stream_create_email(stream):
+    send_stream_create_emails([stream])
+
+
+def send_stream_create_emails(streams):
+    """Queue the sign up emails of several streams"""
+    timeframes = get_formatted_stream_timeframes(streams)
+    support_channels_texts = get_support_channels_texts(streams)
+    emails = []
+    for stream, timeframe, support_channels_text in zip(
+        streams, timeframes, support_channels_texts
+    ):
+        email = get_stream_create_email(stream, timeframe=timeframe)
+        email["variables"].update(support_channels_text=support_channels_text)
+        msg = build_stream_email(stream, template_name="stream_create", **email)
+        emails.append((stream, StreamNotification.Kinds.CREATED, msg))
+    queue_stream_emails(emails)
+
+
+def get_stream_create_email(stream, timeframe=None):
     subject = "$event_name: Thank you for signing up!"
-    starts_at, ends_at = get_formatted_stream_timeframe(stream)
+    starts_at, ends_at = timeframe or get_formatted_stream_timeframe(stream)
     variables = dict(
         name=stream.publisher_name,
         event_name=stream.event.name,
@@ -47,13 +189,7 @@ def send_stream_create_email(stream):
         key=stream.key,
         preparation_time=stream.event.preparation_time,
     )
-    send_stream_email(
-        stream,
-        template_name="stream_create",
-        variables=variables,
-        subject=subject,
-        kind=StreamNotification.Kinds.CREATED,
-    )
+    return dict(variables=variables, subject=subject)
 
 
 def send_stream_update_email(stream):
@@ -74,24 +210,18 @@ def send_stream_update_email(stream):
 
 
 def send_stream_email(stream, *, template_name, variables, subject, kind):
-    template_path = os.path.join(
-        apps.get_app_config("events").path,
-        "templates",
-        "emails",
-        f"{template_name}.txt",
+    msg = build_stream_email(
+        stream, template_name=template_name, variables=variables, subject=subject
     )
-    with open(template_path) as f:
-        body_tpl = f.read()
+    queue_stream_email(stream, kind, msg)
+
 
-    variables.update(support_channels_text=get_support_channels_test(stream))
+def build_stream_email(stream, *, template_name, variables, subject):
+    if "support_channels_text" not in variables:
+        variables.update(support_channels_text=get_support_channels_test(stream))
 
-    body = Template(body_tpl).safe_substitute(variables)
-    subject = Template(subject).safe_substitute(variables)
+    body = email_templates.get(template_name).safe_substitute(variables)
+    subject = get_subject_template(subject).safe_substitute(variables)
     to = [stream.publisher_email]
     headers = {"Reply-To": stream.event.contact_email}
-    msg = EmailMessage(subject, body, None, to, headers=headers)
-
-    msg.send(fail_silently=False)
-
-    stream = None if kind == StreamNotification.Kinds.REMOVED else stream
-    StreamNotification.objects.create(stream=stream, kind=kind, sent_at=timezone.now())
+    return EmailMessage(subject, body, None, to, headers=headers)
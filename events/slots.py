@@ -0,0 +1,200 @@
+import threading
+import time
+from bisect import bisect_left
+
+from django.apps import apps
+from django.conf import settings
+
+
+class Slot:
+    """Time slot taken by a Stream, as needed to check overlaps"""
+
+    __slots__ = ("starts_at", "ends_at", "pk", "key", "publisher_name", "event_name")
+
+    def __init__(self, starts_at, ends_at, pk, key, publisher_name, event_name):
+        self.starts_at = starts_at
+        self.ends_at = ends_at
+        self.pk = pk
+        self.key = key
+        self.publisher_name = publisher_name
+        self.event_name = event_name
+
+    def __lt__(self, other):
+        return (self.starts_at, self.pk) < (other.starts_at, other.pk)
+
+    def __str__(self):
+        # Same as str(stream), without loading its event
+        return "{event_name}: {publisher_name} ({starts_at} - {ends_at})".format(
+            event_name=self.event_name,
+            publisher_name=self.publisher_name,
+            starts_at=self.starts_at,
+            ends_at=self.ends_at,
+        )
+
+
+class EventSlots:
+    """Slots of an event, sorted by start
+
+    `max_ends[i]` is the latest end among the first i+1 slots, so that
+    searching backwards from the last slot starting before some time can stop
+    as soon as no earlier slot may end after it.  When slots don't overlap (as
+    validation ensures) that is right after the first non-overlapping slot.
+
+    """
+
+    def __init__(self, slots, loaded_at):
+        self.slots = sorted(slots)
+        self.starts = [s.starts_at for s in self.slots]
+        self.by_pk = {s.pk: s for s in self.slots}
+        self.max_ends = []
+        self.loaded_at = loaded_at
+        self._update_max_ends(0)
+
+    def overlapping(self, starts_at, ends_at):
+        """Slots overlapping [starts_at, ends_at), sorted by start"""
+        overlapping = []
+        i = bisect_left(self.starts, ends_at) - 1
+        while i >= 0 and self.max_ends[i] > starts_at:
+            if self.slots[i].ends_at > starts_at:
+                overlapping.append(self.slots[i])
+            i -= 1
+        overlapping.reverse()
+        return overlapping
+
+    def add(self, slot):
+        i = bisect_left(self.slots, slot)
+        self.slots.insert(i, slot)
+        self.starts.insert(i, slot.starts_at)
+        self.by_pk[slot.pk] = slot
+        self.max_ends.insert(i, None)
+        self._update_max_ends(i)
+
+    def remove(self, pk):
+        slot = self.by_pk.pop(pk, None)
+        if slot is None:
+            return None
+        i = bisect_left(self.slots, slot)
+        del self.slots[i], self.starts[i], self.max_ends[i]
+        self._update_max_ends(i)
+        return slot
+
+    def _update_max_ends(self, start):
+        del self.max_ends[start:]
+        max_end = self.max_ends[-1] if self.max_ends else None
+        for slot in self.slots[start:]:
+            if max_end is None or slot.ends_at > max_end:
+                max_end = slot.ends_at
+            self.max_ends.append(max_end)
+
+
+class StreamSlotIndex:
+    """Per-process index of stream slots by event, to check overlaps
+
+    The slots of an event are loaded with a single query the first time they
+    are needed, and kept up to date as streams are saved or deleted in this
+    process, once their transaction commits (see `events.signals`).  As other
+    processes may also change them, they are loaded again after
+    `STREAM_SLOT_INDEX_TTL` seconds.
+
+    The index may then be stale, so it only serves as a fast first check, and
+    to describe overlaps without loading them: slots found there are
+    confirmed before being reported, and saved streams are checked again
+    within their transaction (see `events.serializers`).
+
+    """
+
+    def __init__(self):
+        self._events = {}
+        # Event of each indexed stream, to find its slot when it moves
+        self._event_ids = {}
+        self._lock = threading.Lock()
+
+    def overlapping(
+        self,
+        event_id,
+        starts_at,
+        ends_at,
+        exclude_pk=None,
+        exclude_key=None,
+    ):
+        """Slots of an event overlapping [starts_at, ends_at)"""
+        with self._lock:
+            slots = self._get(event_id).overlapping(starts_at, ends_at)
+        return [s for s in slots if s.pk != exclude_pk and s.key != exclude_key]
+
+    def update_stream(self, stream):
+        """Add or move the slot of a saved stream, if its event is loaded"""
+        self.update_streams([stream])
+
+    def update_streams(self, streams):
+        with self._lock:
+            for stream in streams:
+                self._remove(stream.pk)
+                event_slots = self._events.get(stream.event_id)
+                if event_slots is not None:
+                    event_name = self._event_name(event_slots, stream)
+                    event_slots.add(self._make_slot(stream, event_name))
+                    self._event_ids[stream.pk] = stream.event_id
+
+    def remove_stream(self, pk):
+        with self._lock:
+            self._remove(pk)
+
+    def invalidate_event(self, event):
+        with self._lock:
+            self._drop(event.pk)
+
+    def clear(self):
+        with self._lock:
+            self._events.clear()
+            self._event_ids.clear()
+
+    def _get(self, event_id):
+        event_slots = self._events.get(event_id)
+        now = time.monotonic()
+        if (
+            event_slots is None
+            or now - event_slots.loaded_at >= settings.STREAM_SLOT_INDEX_TTL
+        ):
+            self._drop(event_id)
+            event_slots = self._events[event_id] = self._load(event_id, now)
+            for pk in event_slots.by_pk:
+                self._event_ids[pk] = event_id
+        return event_slots
+
+    def _load(self, event_id, now):
+        Stream = apps.get_model("events", "Stream")
+        rows = Stream.objects.filter(event_id=event_id).values_list(
+            "starts_at", "ends_at", "pk", "key", "publisher_name", "event__name"
+        )
+        return EventSlots([Slot(*row) for row in rows], loaded_at=now)
+
+    def _drop(self, event_id):
+        event_slots = self._events.pop(event_id, None)
+        for pk in event_slots.by_pk if event_slots else ():
+            # Unless it moved to another event since
+            if self._event_ids.get(pk) == event_id:
+                del self._event_ids[pk]
+
+    def _remove(self, pk):
+        event_id = self._event_ids.pop(pk, None)
+        if event_id in self._events:
+            self._events[event_id].remove(pk)
+
+    def _event_name(self, event_slots, stream):
+        if event_slots.slots:
+            return event_slots.slots[0].event_name
+        return stream.event.name
+
+    def _make_slot(self, stream, event_name):
+        return Slot(
+            stream.starts_at,
+            stream.ends_at,
+            stream.pk,
+            stream.key,
+            stream.publisher_name,
+            event_name,
+        )
+
+
+slot_index = StreamSlotIndex()
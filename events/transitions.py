@@ -0,0 +1,77 @@
+from datetime import timedelta
+from urllib.parse import urlencode
+from urllib.request import urlopen
+
+from django.conf import settings
+
+from .models import Stream
+from .scheduling import DeadlineScheduler
+
+
+def drop_publisher(stream_key):
+    """Drop a publisher from all nginx-rtmp servers, via their control module
+
+    Once dropped, the publisher reconnects and goes through `on_publish` again,
+    where it is redirected according to its current state.
+
+    """
+    params = urlencode(dict(app=settings.NGINX_RTMP_APPLICATION, name=stream_key))
+    for control_url in settings.NGINX_RTMP_CONTROL_URLS:
+        url = "{}/drop/publisher?{}".format(control_url.rstrip("/"), params)
+        try:
+            with urlopen(url, timeout=settings.NGINX_RTMP_CONTROL_TIMEOUT) as res:
+                res.read()
+        except OSError as err:
+            # nginx-rtmp answers 404 when there is no such publisher.  Also
+            # timeouts, which may happen while reading the response too
+            print("[TRANSITION] Could not drop publisher at %s: %s" % (url, err))
+
+
+class TransitionScheduler(DeadlineScheduler):
+    """Drops publishers of streams exactly when they become active or inactive
+
+    This replaces polling for transitions in `on_update`, which is still there
+    as a fallback, so `notify_update_timeout` can be raised on nginx-rtmp.
+    Streams created or changed by the web workers are picked up from
+    `Stream.updated_at` every `changes_interval` seconds.  Moved streams keep
+    their old deadlines, where publishers are dropped needlessly but
+    harmlessly, as they are let back in by `on_publish`.
+
+    """
+
+    # How far ahead to look for stream boundaries on each refresh
+    horizon = timedelta(days=1)
+    changes_interval = 10
+    log_name = "TRANSITION"
+
+    def __init__(self, drop_publisher=drop_publisher):
+        super().__init__()
+        self.drop_publisher = drop_publisher
+
+    def get_deadlines(self, now):
+        return self.get_stream_deadlines(now)
+
+    def get_changes(self, since, now):
+        return self.get_stream_deadlines(since, updated_at__gte=since)
+
+    def get_stream_deadlines(self, now, **filters):
+        streams = Stream.objects.filter(
+            event__active=True,
+            ends_at__gt=now,
+            starts_at__lt=now + self.horizon,
+            **filters,
+        ).select_related("event")
+
+        for stream in streams:
+            event = stream.event
+            begin = max(stream.starts_at, event.starts_at)
+            end = min(stream.ends_at, event.ends_at)
+            yield (begin, stream.key)
+            yield (end, stream.key)
+
+    def fire(self, stream_key, now):
+        print(
+            "[TRANSITION] Stream %s changed state at %s. Drop publisher."
+            % (stream_key, now)
+        )
+        self.drop_publisher(stream_key)
@@ -1,34 +1,76 @@
+from functools import lru_cache
+
 import pytz
-from django.utils import timezone
+from django.db.models import prefetch_related_objects
+
+DATETIME_FORMAT = "%c %z"
+
+
+@lru_cache(maxsize=None)
+def get_timezone(name):
+    return pytz.timezone(name)
 
 
 def get_formatted_stream_timeframe(stream):
-    starts_at = stream.starts_at.strftime("%c %z")
-    ends_at = stream.ends_at.strftime("%c %z")
-
-    if stream.timezone:
-        tzinfo = pytz.timezone(stream.timezone)
-        starts_at_tz = timezone.make_aware(
-            timezone.make_naive(stream.starts_at, timezone=tzinfo), timezone=tzinfo
-        ).strftime("%c %z")
-        ends_at_tz = timezone.make_aware(
-            timezone.make_naive(stream.ends_at, timezone=tzinfo), timezone=tzinfo
-        ).strftime("%c %z")
-    else:
-        starts_at_tz = ends_at_tz = None
+    return get_formatted_stream_timeframes([stream])[0]
+
+
+def get_formatted_stream_timeframes(streams):
+    """Formatted (starts_at, ends_at) of several streams, in the same order
 
-    starts_at_s = f"{starts_at_tz} ({starts_at})" if starts_at_tz else starts_at
-    ends_at_s = f"{ends_at_tz} ({ends_at})" if ends_at_tz else ends_at
+    Each timezone is resolved once, and each time formatted once per timezone,
+    as streams of an event usually share both.
 
-    return starts_at_s, ends_at_s
+    """
+    formatted = {}
+
+    def format_time(value, tzname):
+        try:
+            return formatted[value, tzname]
+        except KeyError:
+            pass
+        s = value.strftime(DATETIME_FORMAT)
+        if tzname:
+            value_tz = value.astimezone(get_timezone(tzname))
+            s = f"{value_tz.strftime(DATETIME_FORMAT)} ({s})"
+        formatted[value, tzname] = s
+        return s
+
+    return [
+        (
+            format_time(stream.starts_at, stream.timezone),
+            format_time(stream.ends_at, stream.timezone),
+        )
+        for stream in streams
+    ]
 
 
 def get_support_channels_test(stream):
-    if stream.event.support_urls.exists():
+    # Uses support URLs prefetched with the event, if any
+    support_urls = list(stream.event.support_urls.all())
+    if support_urls:
         return (
             "Streaming documentation and support links.\n"
             + "If you have any questions, please reach out to our support channel:\n"
-            + "\n".join(f"* {u.name}: {u.url}" for u in stream.event.support_urls.all())
+            + "\n".join(f"* {u.name}: {u.url}" for u in support_urls)
         )
     else:
         return "If you have any questions, please reach out to our support channel."
+
+
+def get_support_channels_texts(streams):
+    """Support channels text of several streams, in the same order
+
+    Support URLs are fetched with a single query for all the events, and the
+    text is built once per event.
+
+    """
+    by_event = {}
+    for stream in streams:
+        by_event.setdefault(stream.event_id, stream)
+    prefetch_related_objects([s.event for s in by_event.values()], "support_urls")
+    texts = {
+        event_id: get_support_channels_test(stream)
+        for event_id, stream in by_event.items()
+    }
+    return [texts[stream.event_id] for stream in streams]
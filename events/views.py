@@ -1,16 +1,33 @@
 from datetime import timedelta
+from urllib.parse import urlparse
 
 from django.conf import settings
-from django.http import HttpResponse, HttpResponseForbidden, HttpResponseRedirect
-from django.shortcuts import get_object_or_404
+from django.core.exceptions import ValidationError
+from django.http import (
+    Http404,
+    HttpResponse,
+    HttpResponseForbidden,
+    HttpResponseNotFound,
+    HttpResponseRedirect,
+)
 from django.utils import timezone
+from django.utils.cache import parse_etags
 from django.views.decorators.http import require_GET, require_POST
-from rest_framework import permissions, viewsets
-from rest_framework.exceptions import ParseError
-
+from rest_framework import permissions, status, viewsets
+from rest_framework.decorators import action
+from rest_framework.exceptions import ParseError, PermissionDenied
+from rest_framework.response import Response
+
+from events.cache import schedule_cache
+from events.keyfilter import key_filter
+from events.livestate import live_state
 from events.models import Event, Stream
 from events.permissions import HasCustomAPIKey, HasStreamKey
+from events.ratelimit import get_client_address, get_publisher_address, rate_limit
+from events.recordings import recordings_index
+from events.revisions import make_etag
 from events.serializers import (
+    BulkStreamSerializer,
     EventSerializer,
     PublicEventSerializer,
     PublicStreamSerializer,
@@ -28,9 +45,71 @@ class APIKeyViewMixin:
         return hasattr(self.request, "is_web") and self.request.is_web
 
 
-class EventViewSet(viewsets.ModelViewSet, APIKeyViewMixin):
+class ConditionalGetMixin:
+    """Answers list and detail requests with an ETag, or 304 if it matches
+
+    The ETag is made from the revisions of the events shown (see
+    `events.revisions`), which are fetched before anything else, so polling
+    unchanged resources costs a single small query and no serialization.
+
+    """
+
+    def list(self, request, *args, **kwargs):
+        return self.get_conditional_response(super().list, request, *args, **kwargs)
+
+    def retrieve(self, request, *args, **kwargs):
+        return self.get_conditional_response(
+            super().retrieve, request, *args, **kwargs
+        )
+
+    def get_conditional_response(self, handler, request, *args, **kwargs):
+        revisions = self.get_event_revisions()
+        # Only for JSON, the browsable API also shows forms and the user
+        if revisions is None or request.accepted_renderer.format != "json":
+            return handler(request, *args, **kwargs)
+
+        etag = make_etag(self.get_etag_variant(), revisions)
+        if etag in parse_etags(request.headers.get("If-None-Match", "")):
+            return Response(
+                status=status.HTTP_304_NOT_MODIFIED, headers={"ETag": etag}
+            )
+        response = handler(request, *args, **kwargs)
+        if response.status_code == status.HTTP_200_OK:
+            response["ETag"] = etag
+        return response
+
+    def get_event_revisions(self):
+        """(event id, revision) pairs of the events shown, or None if unknown"""
+        raise NotImplementedError
+
+    def get_object_revisions(self, queryset, *fields):
+        """Revisions of the object looked up by retrieve(), if it exists"""
+        lookup = self.kwargs[self.lookup_url_kwarg or self.lookup_field]
+        try:
+            revisions = list(
+                queryset.filter(**{self.lookup_field: lookup}).values_list(*fields)
+            )
+        except (TypeError, ValueError, ValidationError):
+            revisions = None
+        # Otherwise let retrieve() answer with 404
+        return revisions or None
+
+    def get_etag_variant(self):
+        # Responses also depend on the page, filters and host (in hyperlinks),
+        # and on the serializer used for this client
+        return "%s %s" % (
+            self.request.build_absolute_uri(),
+            self.get_serializer_class().__name__,
+        )
+
+
+class EventViewSet(ConditionalGetMixin, viewsets.ModelViewSet, APIKeyViewMixin):
     serializer_class = EventSerializer
-    queryset = Event.objects.all().order_by("-starts_at")
+    queryset = (
+        Event.objects.all()
+        .prefetch_related("stream_urls", "support_urls")
+        .order_by("-starts_at")
+    )
     permission_classes = [HasCustomAPIKey | permissions.IsAuthenticated]
     filterset_fields = (
         "slug",
@@ -42,9 +121,20 @@ class EventViewSet(viewsets.ModelViewSet, APIKeyViewMixin):
             return PublicEventSerializer
         return EventSerializer
 
+    def get_event_revisions(self):
+        events = self.filter_queryset(self.get_queryset()).prefetch_related(None)
+        if self.action == "retrieve":
+            return self.get_object_revisions(events, "pk", "revision")
+        return list(events.values_list("pk", "revision"))
+
 
-class StreamViewSet(viewsets.ModelViewSet, APIKeyViewMixin):
-    queryset = Stream.objects.all().order_by("-event__starts_at", "starts_at")
+class StreamViewSet(ConditionalGetMixin, viewsets.ModelViewSet, APIKeyViewMixin):
+    queryset = (
+        Stream.objects.all()
+        .select_related("event")
+        .prefetch_related("archive_urls")
+        .order_by("-event__starts_at", "starts_at")
+    )
     permission_classes = [HasCustomAPIKey | permissions.IsAuthenticated, HasStreamKey]
     filterset_fields = (
         "event__id",
@@ -54,11 +144,56 @@ class StreamViewSet(viewsets.ModelViewSet, APIKeyViewMixin):
         "key",
     )
 
+    def get_object(self):
+        # HasStreamKey needs the stream too, so fetch it once per request
+        if not hasattr(self, "_object"):
+            self._object = super().get_object()
+        return self._object
+
+    def get_event_revisions(self):
+        streams = self.filter_queryset(self.get_queryset()).prefetch_related(None)
+        if self.action == "retrieve":
+            return self.get_object_revisions(streams, "event_id", "event__revision")
+        return list(
+            Event.objects.filter(pk__in=streams.values("event_id")).values_list(
+                "pk", "revision"
+            )
+        )
+
+    def get_etag_variant(self):
+        variant = super().get_etag_variant()
+        # Recordings are listed from the filesystem, not the database
+        if settings.RECORDINGS_ROOT and not self.is_public_readonly_request:
+            variant += " %s" % recordings_index.version()
+        return variant
+
     def get_serializer_class(self):
+        if self.action == "bulk":
+            return BulkStreamSerializer
         if self.is_public_readonly_request:
             return PublicStreamSerializer
         return StreamSerializer
 
+    @action(detail=False, methods=["post"])
+    def bulk(self, request):
+        """Create streams, or update those with an existing key, in one request"""
+        # Web clients can only change their own streams, see HasStreamKey
+        if self.is_web_request:
+            raise PermissionDenied()
+        serializer = self.get_serializer(data=request.data, many=True)
+        serializer.is_valid(raise_exception=True)
+        streams = serializer.save()
+
+        streams_by_pk = self.get_queryset().in_bulk([s.pk for s in streams])
+        data = StreamSerializer(
+            [streams_by_pk[s.pk] for s in streams],
+            many=True,
+            context=self.get_serializer_context(),
+        ).data
+        if serializer.created:
+            return Response(data, status=status.HTTP_201_CREATED)
+        return Response(data)
+
     @property
     def is_public_readonly_request(self):
         return (
@@ -72,16 +207,29 @@ class StreamViewSet(viewsets.ModelViewSet, APIKeyViewMixin):
         return self.request.headers.get(settings.STREAM_KEY_HEADER)
 
 
-@require_POST
-def on_publish(request):
-    # nginx-rtmp makes the stream name available in the POST body via `name`
-    stream_key = request.POST["name"]
+def get_stream_schedule_or_404(stream_key):
+    schedule = schedule_cache.peek(stream_key)
+    if schedule is not None:
+        return schedule
+    # Reject unknown keys (e.g. from scanners) without querying the database
+    if not key_filter.might_exist(stream_key):
+        raise Http404("No Stream matches the given query.")
+    try:
+        return schedule_cache.load(stream_key)
+    except Stream.DoesNotExist:
+        raise Http404("No Stream matches the given query.")
 
-    # Lookup the activity and verify the publisher is allowed to stream.
-    stream = get_object_or_404(Stream, key=stream_key)
 
-    now = timezone.now()
+class PublishAction:
+    """Outcomes of a publisher connecting with a stream key"""
+
+    DENY = "deny"
+    ALLOW = "allow"
+    REDIRECT_TEST = "redirect_test"
+    GO_LIVE = "go_live"
 
+
+def get_publish_action(stream, now):
     # If stream is not valid (i.e. not preparing or inactive)
     if not stream.is_valid_at(now):
         # If event has a test RTMP URL, redirect to it
@@ -90,11 +238,11 @@ def on_publish(request):
                 "[PUBLISH] Stream is not valid now (%s). Redirect to Test RTMP URL."
                 % (now)
             )
-            return RtmpRedirect(stream.resolved_test_rtmp_url)
+            return PublishAction.REDIRECT_TEST
         else:
             # Otherwise, deny the stream
             print("[PUBLISH] Stream is not valid now (%s)" % (now))
-            return HttpResponseForbidden("Stream is not valid now")
+            return PublishAction.DENY
 
     # If event has a custom RTMP URL, redirect to it
     if stream.event.rtmp_url:
@@ -103,42 +251,55 @@ def on_publish(request):
                 print(
                     "[PUBLISH] Stream is preparing and not active yet. Redirect to Test RTMP URL."
                 )
-                return RtmpRedirect(stream.resolved_test_rtmp_url)
+                return PublishAction.REDIRECT_TEST
             else:
                 print("[PUBLISH] Stream is preparing and not active yet. Allow.")
-                return HttpResponse("OK")
+                return PublishAction.ALLOW
         else:
-            # Set the stream live
-            stream.live_at = now
-            stream.save()
-
             print("[PUBLISH] Stream is active. Allow and redirect to custom RTMP URL.")
-            return RtmpRedirect(stream.resolved_rtmp_url)
+            return PublishAction.GO_LIVE
     else:
         print("[PUBLISH] Stream is active. Allow.")
-        return HttpResponse("OK")
+        return PublishAction.ALLOW
 
 
-@require_POST
-def on_publish_done(request):
-    # When a stream stops nginx-rtmp will still dispatch callbacks
-    # using the original stream key, not the redirected stream name.
-    stream_key = request.POST["name"]
+def get_publish_redirect_url(schedule, action):
+    if action == PublishAction.REDIRECT_TEST:
+        return schedule.test_rtmp_url
+    if action == PublishAction.GO_LIVE:
+        return schedule.rtmp_url
 
-    # Set the stream offline
-    Stream.objects.filter(key=stream_key).update(live_at=None)
 
-    # Response is ignored.
-    print("[PUBLISH-DONE] Stream stopped streaming")
+def get_publish_response(action, redirect_url):
+    if action == PublishAction.DENY:
+        return HttpResponseForbidden("Stream is not valid now")
+    if redirect_url:
+        return RtmpRedirect(redirect_url)
     return HttpResponse("OK")
 
 
-@require_POST
-def on_update(request):
-    stream_key = request.POST["name"]
-    stream = get_object_or_404(Stream, key=stream_key)
+def set_stream_live(stream, at, ingest_node, redirect_url):
+    # Buffered and written without saving the instance, which would also
+    # needlessly invalidate its cached schedule.
+    live_state.set_live(
+        stream, at, ingest_node=ingest_node, redirect_url=redirect_url
+    )
 
-    now = timezone.now()
+
+def set_stream_offline(stream_key, at):
+    live_state.set_offline(stream_key, at)
+
+
+def get_ingest_node(request):
+    # Callbacks go through a proxy, so the node is the host the publisher
+    # connected to, which nginx-rtmp sends in the `tcUrl` field
+    try:
+        return urlparse(request.POST.get("tcUrl", "")).hostname or ""
+    except ValueError:
+        return ""
+
+
+def get_update_response(stream, now):
     last_update = now - timedelta(seconds=settings.NGINX_RTMP_UPDATE_TIMEOUT)
 
     # nginx-rtmp only redirects when connecting for the first time. If publisher
@@ -166,15 +327,67 @@ def on_update(request):
     return HttpResponse("OK")
 
 
+@require_POST
+@rate_limit(get_publisher_address)
+def on_publish(request):
+    # nginx-rtmp makes the stream name available in the POST body via `name`
+    stream_key = request.POST["name"]
+
+    # Lookup the activity and verify the publisher is allowed to stream.
+    schedule = get_stream_schedule_or_404(stream_key)
+
+    now = timezone.now()
+    action = get_publish_action(schedule.stream, now)
+
+    redirect_url = get_publish_redirect_url(schedule, action)
+    if redirect_url:
+        redirect_url = redirect_url.resolve()
+
+    # Set the stream live
+    if action == PublishAction.GO_LIVE:
+        set_stream_live(
+            schedule.stream, now, get_ingest_node(request), redirect_url
+        )
+
+    return get_publish_response(action, redirect_url)
+
+
+@require_POST
+def on_publish_done(request):
+    # When a stream stops nginx-rtmp will still dispatch callbacks
+    # using the original stream key, not the redirected stream name.
+    stream_key = request.POST["name"]
+
+    # Set the stream offline
+    set_stream_offline(stream_key, timezone.now())
+
+    # Response is ignored.
+    print("[PUBLISH-DONE] Stream stopped streaming")
+    return HttpResponse("OK")
+
+
+# Not rate limited: publishers already live (maybe several behind the same
+# address) would be dropped by nginx-rtmp
+@require_POST
+def on_update(request):
+    stream_key = request.POST["name"]
+    stream = get_stream_schedule_or_404(stream_key).stream
+
+    return get_update_response(stream, timezone.now())
+
+
 @require_GET
+@rate_limit(get_client_address)
 def streams_check_key(request):
     stream_key = request.GET.get("key")
     if not stream_key:
         raise ParseError("Missing key parameter")
 
-    stream = Stream.objects.filter(key=stream_key).first()
+    stream = None
+    if key_filter.might_exist(stream_key):
+        stream = Stream.objects.filter(key=stream_key).first()
     if not stream:
-        raise HttpResponse(
+        return HttpResponseNotFound(
             "There is no Stream with the key %s" % (stream_key),
         )
 
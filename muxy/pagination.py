@@ -1,7 +1,205 @@
-from rest_framework.pagination import PageNumberPagination
+import json
+from base64 import b64decode, b64encode
+from functools import reduce
+
+from django.core.exceptions import ValidationError
+from django.db.models import Q
+from django.utils.translation import gettext_lazy as _
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination, PageNumberPagination
+from rest_framework.response import Response
+from rest_framework.settings import api_settings
+from rest_framework.utils.urls import replace_query_param
 
 
 class StandardResultsSetPagination(PageNumberPagination):
     page_size = 100
     page_size_query_param = 'page_size'
-    max_page_size = 1000
\ No newline at end of file
+    max_page_size = 1000
+
+
+class KeysetPagination(BasePagination):
+    """Cursor pagination over the full ordering of a queryset
+
+    Unlike DRF's CursorPagination, which positions the cursor on the first
+    ordering field only and skips rows sharing its value with an OFFSET, the
+    cursor holds the values of every ordering field of the last row, plus its
+    primary key as a tiebreaker.  Each page is then fetched with a single
+    `WHERE (a, b, id) > (...) ORDER BY a, b, id LIMIT n` query, without
+    counting rows, so deep pages cost as much as the first one.
+
+    """
+
+    cursor_query_param = "cursor"
+    page_size = api_settings.PAGE_SIZE
+    invalid_cursor_message = _("Invalid cursor")
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.ordering = self.get_ordering(queryset)
+        position, self.reverse = self.decode_cursor(request, queryset.model)
+
+        if self.reverse:
+            queryset = queryset.order_by(
+                *(name if desc else "-" + name for name, desc in self.ordering)
+            )
+        else:
+            queryset = queryset.order_by(
+                *("-" + name if desc else name for name, desc in self.ordering)
+            )
+        if position is not None:
+            queryset = queryset.filter(self.get_position_filter(position))
+
+        results = list(queryset[: self.page_size + 1])
+        has_more = len(results) > self.page_size
+        results = results[: self.page_size]
+        if self.reverse:
+            results.reverse()
+            self.has_next, self.has_previous = True, has_more
+        else:
+            self.has_next, self.has_previous = has_more, position is not None
+
+        if results:
+            self.next_position = self.get_position(results[-1])
+            self.previous_position = self.get_position(results[0])
+        else:
+            self.next_position = self.previous_position = position
+        return results
+
+    def get_paginated_response(self, data):
+        return Response(
+            dict(
+                next=self.get_next_link(),
+                previous=self.get_previous_link(),
+                results=data,
+            )
+        )
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            "type": "object",
+            "properties": {
+                "next": {"type": "string", "nullable": True},
+                "previous": {"type": "string", "nullable": True},
+                "results": schema,
+            },
+        }
+
+    def get_schema_operation_parameters(self, view):
+        return [
+            {
+                "name": self.cursor_query_param,
+                "required": False,
+                "in": "query",
+                "description": "The pagination cursor value.",
+                "schema": {"type": "string"},
+            }
+        ]
+
+    def get_next_link(self):
+        if not self.has_next or self.next_position is None:
+            return None
+        return self.encode_cursor(self.next_position, reverse=False)
+
+    def get_previous_link(self):
+        if not self.has_previous or self.previous_position is None:
+            return None
+        return self.encode_cursor(self.previous_position, reverse=True)
+
+    def get_ordering(self, queryset):
+        """Ordering fields of the queryset as (name, descending) pairs, plus pk"""
+        ordering = [
+            (name.lstrip("-"), name.startswith("-"))
+            for name in queryset.query.order_by
+        ]
+        if not any(name in ("pk", "id") for name, _ in ordering):
+            # Follow the direction of the last field so that a single index
+            # on (..., id) can be scanned
+            ordering.append(("id", ordering[-1][1] if ordering else False))
+        return ordering
+
+    def get_position(self, obj):
+        position = []
+        for name, _ in self.ordering:
+            value = obj
+            for attr in name.split("__"):
+                value = getattr(value, attr)
+            position.append(value)
+        return position
+
+    def get_position_filter(self, position):
+        """Rows after `position`, i.e. (a, b, id) > (va, vb, vid) in ordering terms"""
+        conditions = []
+        for i, ((name, desc), value) in enumerate(zip(self.ordering, position)):
+            lookup = "__lt" if desc != self.reverse else "__gt"
+            equal = [Q(**{n: v}) for (n, _), v in zip(self.ordering[:i], position)]
+            conditions.append(reduce(Q.__and__, equal, Q(**{name + lookup: value})))
+        return reduce(Q.__or__, conditions)
+
+    def encode_cursor(self, position, reverse):
+        values = [
+            value.isoformat() if hasattr(value, "isoformat") else value
+            for value in position
+        ]
+        cursor = json.dumps(dict(p=values, r=int(reverse)), separators=(",", ":"))
+        cursor = b64encode(cursor.encode()).decode()
+        url = self.request.build_absolute_uri()
+        return replace_query_param(url, self.cursor_query_param, cursor)
+
+    def decode_cursor(self, request, model):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None, False
+        try:
+            cursor = json.loads(b64decode(encoded.encode()).decode())
+            values, reverse = cursor["p"], bool(cursor["r"])
+            if len(values) != len(self.ordering):
+                raise ValueError
+            position = [
+                self.get_field(model, name).to_python(value)
+                for (name, _), value in zip(self.ordering, values)
+            ]
+        except (TypeError, ValueError, KeyError, ValidationError):
+            raise NotFound(self.invalid_cursor_message)
+        return position, reverse
+
+    def get_field(self, model, name):
+        *relations, field_name = name.split("__")
+        for relation in relations:
+            model = model._meta.get_field(relation).related_model
+        return model._meta.get_field(field_name)
+
+
+class PageNumberOrKeysetPagination(PageNumberPagination):
+    """Page number pagination, or keyset pagination with `?pagination=cursor`"""
+
+    mode_query_param = "pagination"
+    keyset_mode = "cursor"
+    keyset_pagination_class = KeysetPagination
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.keyset = None
+        if request.query_params.get(self.mode_query_param) == self.keyset_mode:
+            self.keyset = self.keyset_pagination_class()
+            self.display_page_controls = False
+            return self.keyset.paginate_queryset(queryset, request, view)
+        return super().paginate_queryset(queryset, request, view)
+
+    def get_paginated_response(self, data):
+        if self.keyset is not None:
+            return self.keyset.get_paginated_response(data)
+        return super().get_paginated_response(data)
+
+    def get_schema_operation_parameters(self, view):
+        return [
+            *super().get_schema_operation_parameters(view),
+            {
+                "name": self.mode_query_param,
+                "required": False,
+                "in": "query",
+                "description": "Set to `cursor` to paginate with cursors "
+                "(without counting results) instead of page numbers.",
+                "schema": {"type": "string", "enum": [self.keyset_mode]},
+            },
+            *self.keyset_pagination_class().get_schema_operation_parameters(view),
+        ]
@@ -0,0 +1,20 @@
+"""
+ASGI config for the nginx-rtmp callbacks application.
+
+It exposes the ASGI callable as a module-level variable named ``application``,
+serving the asynchronous versions of the callbacks.  Run it with uvicorn
+workers, e.g. `gunicorn -k uvicorn.workers.UvicornWorker muxy.rtmp_asgi:application`.
+See `muxy.settings_rtmp`.
+"""
+
+import os
+
+from django.core.asgi import get_asgi_application
+from dotenv import load_dotenv
+
+load_dotenv()
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'muxy.settings_rtmp')
+os.environ.setdefault('RTMP_CALLBACKS_ASYNC', '1')
+
+application = get_asgi_application()
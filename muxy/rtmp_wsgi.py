@@ -0,0 +1,17 @@
+"""
+WSGI config for the nginx-rtmp callbacks application.
+
+It exposes the WSGI callable as a module-level variable named ``application``.
+See `muxy.settings_rtmp`.
+"""
+
+import os
+
+from django.core.wsgi import get_wsgi_application
+from dotenv import load_dotenv
+
+load_dotenv()
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'muxy.settings_rtmp')
+
+application = get_wsgi_application()
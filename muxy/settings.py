@@ -136,13 +136,69 @@ STATIC_ROOT = os.path.join(BASE_DIR, "static")
 
 REST_FRAMEWORK = {
     "DEFAULT_SCHEMA_CLASS": "drf_spectacular.openapi.AutoSchema",
-    "DEFAULT_PAGINATION_CLASS": "rest_framework.pagination.PageNumberPagination",
+    "DEFAULT_PAGINATION_CLASS": "muxy.pagination.PageNumberOrKeysetPagination",
     "DEFAULT_FILTER_BACKENDS": ["django_filters.rest_framework.DjangoFilterBackend"],
     "PAGE_SIZE": 1000,
 }
 
+# Must match notify_update_timeout in the nginx-rtmp configuration, raise
+# both together
 NGINX_RTMP_UPDATE_TIMEOUT = int(os.getenv("NGINX_RTMP_UPDATE_TIMEOUT", "10"))
 
+# nginx-rtmp application and control module URLs (comma-separated, e.g.
+# http://nginx-rtmp:8080/control), used to drop publishers on transitions
+NGINX_RTMP_APPLICATION = os.getenv("NGINX_RTMP_APPLICATION", "live")
+NGINX_RTMP_CONTROL_URLS = [
+    u for u in os.getenv("NGINX_RTMP_CONTROL_URLS", "").split(",") if u
+]
+NGINX_RTMP_CONTROL_TIMEOUT = int(os.getenv("NGINX_RTMP_CONTROL_TIMEOUT", "5"))
+
+# Use the asynchronous nginx-rtmp callbacks (for ASGI deployments)
+RTMP_CALLBACKS_ASYNC = int(os.getenv("RTMP_CALLBACKS_ASYNC") or "0") > 0
+
+# Per-process cache of stream schedules used by the nginx-rtmp callbacks.
+# Set TTL to 0 to disable it.
+STREAM_SCHEDULE_CACHE_TTL = int(os.getenv("STREAM_SCHEDULE_CACHE_TTL", "60"))
+STREAM_SCHEDULE_CACHE_MAX_SIZE = int(
+    os.getenv("STREAM_SCHEDULE_CACHE_MAX_SIZE", "10000")
+)
+
+# Seconds before reloading the per-process index of stream slots of an event,
+# used to check overlaps, to pick up changes made by other processes.
+STREAM_SLOT_INDEX_TTL = int(os.getenv("STREAM_SLOT_INDEX_TTL", "10"))
+
+# Per-process cache of verified API keys, so that repeated requests with the
+# same key are not hashed again.  Set TTL to 0 to disable it.
+API_KEY_CACHE_TTL = int(os.getenv("API_KEY_CACHE_TTL", "60"))
+API_KEY_CACHE_MAX_SIZE = int(os.getenv("API_KEY_CACHE_MAX_SIZE", "1024"))
+
+# Seconds between rebuilds of the per-process filter of existing stream keys,
+# used to reject unknown keys without querying the database.  Keys created by
+# other processes are rejected until the next rebuild.  0 disables it.
+STREAM_KEY_FILTER_TTL = int(os.getenv("STREAM_KEY_FILTER_TTL", "10"))
+
+# Per-client rate limit of the nginx-rtmp callbacks and the check key endpoint,
+# in requests per second, with bursts of up to RATE_LIMIT_BURST requests.
+# Set rate to 0 to disable it.
+RATE_LIMIT_RATE = float(os.getenv("RATE_LIMIT_RATE", "2"))
+RATE_LIMIT_BURST = int(os.getenv("RATE_LIMIT_BURST", "20"))
+
+# Addresses of the reverse proxies whose X-Real-IP header is trusted as the
+# client address, e.g. for rate limiting (comma-separated)
+TRUSTED_PROXIES = [
+    p for p in os.getenv("TRUSTED_PROXIES", "127.0.0.1,::1").split(",") if p
+]
+
+# Interval in seconds between batched writes of streams going live or offline.
+# Set to 0 to write them right away.
+LIVE_STATE_FLUSH_INTERVAL = float(os.getenv("LIVE_STATE_FLUSH_INTERVAL", "2"))
+
+# Cache of resolved RTMP hostnames, in seconds.  Expired addresses are still
+# used for DNS_CACHE_STALE_TTL more seconds while refreshed in the background.
+DNS_CACHE_TTL = int(os.getenv("DNS_CACHE_TTL", "300"))
+DNS_CACHE_NEGATIVE_TTL = int(os.getenv("DNS_CACHE_NEGATIVE_TTL", "30"))
+DNS_CACHE_STALE_TTL = int(os.getenv("DNS_CACHE_STALE_TTL", "3600"))
+
 EMAIL_BACKEND = os.getenv(
     "EMAIL_BACKEND", "django.core.mail.backends.console.EmailBackend"
 )
@@ -153,6 +209,23 @@ EMAIL_HOST_PASSWORD = os.getenv("EMAIL_HOST_PASSWORD")
 EMAIL_USE_TLS = os.getenv("EMAIL_USE_TLS")
 DEFAULT_FROM_EMAIL = os.getenv("EMAIL_FROM", "Muxy <muxy@localhost>")
 
+# Emails sent in bulk reuse one connection per batch of EMAIL_BATCH_SIZE
+# emails, with up to EMAIL_CONCURRENCY connections at a time, and at most
+# EMAIL_RATE_LIMIT emails per second (0 for no limit)
+EMAIL_BATCH_SIZE = int(os.getenv("EMAIL_BATCH_SIZE", "50"))
+EMAIL_CONCURRENCY = int(os.getenv("EMAIL_CONCURRENCY", "1"))
+EMAIL_RATE_LIMIT = float(os.getenv("EMAIL_RATE_LIMIT", "0"))
+
+# Notification emails are queued and delivered by the deliver_emails command
+# (or DeliverEmailsJob).  Failed emails are retried after RETRY_DELAY seconds,
+# doubling each time up to MAX_RETRY_DELAY, at most MAX_ATTEMPTS times.
+EMAIL_OUTBOX_POLL_INTERVAL = int(os.getenv("EMAIL_OUTBOX_POLL_INTERVAL", "5"))
+EMAIL_OUTBOX_RETRY_DELAY = int(os.getenv("EMAIL_OUTBOX_RETRY_DELAY", "60"))
+EMAIL_OUTBOX_MAX_RETRY_DELAY = int(os.getenv("EMAIL_OUTBOX_MAX_RETRY_DELAY", "3600"))
+EMAIL_OUTBOX_MAX_ATTEMPTS = int(os.getenv("EMAIL_OUTBOX_MAX_ATTEMPTS", "8"))
+# Seconds before emails claimed by a worker that died can be claimed again
+EMAIL_OUTBOX_CLAIM_TIMEOUT = int(os.getenv("EMAIL_OUTBOX_CLAIM_TIMEOUT", "300"))
+
 LOGGING = {
     "version": 1,
     "disable_existing_loggers": False,
@@ -167,14 +240,22 @@ LOGGING = {
     },
 }
 
+# Publishers are notified before their streams start by the
+# run_notification_scheduler command, instead of NotifyStreamPreparingJob
 CRON_CLASSES = [
     "events.cron.NotifyStreamPreparingJob",
+    "events.cron.RollupLiveSessionsJob",
+    "events.cron.DeliverEmailsJob",
 ]
 DJANGO_CRON_DELETE_LOGS_OLDER_THAN = 2
 
 RECORDINGS_ROOT = os.getenv("RECORDINGS_ROOT")
 RECORDINGS_URL = os.getenv("RECORDINGS_URL", "/recordings/")
 RECORDINGS_GLOB_PATTERN = os.getenv("RECORDINGS_GLOB_PATTERN", "$event_slug/$key-*.mp4")
+# Seconds between checks for changes in the recordings directories
+RECORDINGS_INDEX_REFRESH_INTERVAL = int(
+    os.getenv("RECORDINGS_INDEX_REFRESH_INTERVAL", "10")
+)
 
 API_VERSION = 1
 
@@ -0,0 +1,16 @@
+"""
+Django settings for the nginx-rtmp callbacks application.
+
+nginx-rtmp sends no cookies, sessions or CSRF tokens, so the callbacks are
+served without any middleware and with a URLconf that only includes them.
+Run it on its own worker pool with `muxy.rtmp_wsgi:application`, or with
+`muxy.rtmp_asgi:application` for the asynchronous callbacks.
+"""
+
+from muxy.settings import *  # noqa: F401,F403
+
+MIDDLEWARE = []
+
+ROOT_URLCONF = "events.rtmp_urls"
+
+WSGI_APPLICATION = "muxy.rtmp_wsgi.application"